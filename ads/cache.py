@@ -0,0 +1,225 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+
+from ads.choices import DataType
+from ads.models import Category, CategoryProperty, City, Location, Neighbourhood, Property
+from core.cache import VersionedCache, bump_version, get_version
+from core.db_routers import use_primary
+
+
+class CategoryTree:
+    """
+    The whole category hierarchy held in memory: names, parents, paths, active flags and children by parent
+    """
+
+    def __init__(self, rows):
+        self.nodes = {}
+        self.children = {}
+
+        for category_id, parent_id, name, is_active, path in rows:
+            self.nodes[category_id] = {
+                'id': category_id, 'parent_id': parent_id, 'name': name, 'is_active': is_active, 'path': path,
+            }
+            self.children.setdefault(parent_id, []).append(category_id)
+
+    def get(self, category_id):
+        return self.nodes.get(category_id)
+
+    def children_of(self, parent_id):
+        return [
+            {'id': child_id, 'name': self.nodes[child_id]['name']} for child_id in self.children.get(parent_id, [])
+        ]
+
+    def is_leaf(self, category_id):
+        return not self.children.get(category_id)
+
+    def hierarchy(self, category_id):
+        node = self.nodes.get(category_id)
+
+        if node is None:
+            return []
+
+        return [
+            {'id': ancestor_id, 'name': self.nodes[ancestor_id]['name']}
+            for ancestor_id in node['path'] if ancestor_id in self.nodes
+        ]
+
+
+def build_category_tree():
+    return CategoryTree(
+        Category.objects.order_by('id').values_list('id', 'parent_id', 'name', 'is_active', 'path')
+    )
+
+
+category_tree_cache = VersionedCache('category-tree', build_category_tree)
+
+
+def get_category_tree():
+    return category_tree_cache.get()
+
+
+async def aget_category_tree():
+    return await category_tree_cache.aget()
+
+
+class LocationTree:
+    """
+    Location -> City -> Neighbourhood, with the JSON payload and its ETag rendered once per version.
+
+    The payload nests [id, name, children] lists to keep it small: [[location_id, name, [[city_id, name,
+    [[neighbourhood_id, name], ...]], ...]], ...].
+    """
+
+    def __init__(self, locations, cities, neighbourhoods):
+        self.locations = {location_id: name for location_id, name in locations}
+        self.cities = {city_id: (location_id, name) for city_id, location_id, name in cities}
+        self.neighbourhoods = {
+            neighbourhood_id: (city_id, name) for neighbourhood_id, city_id, name in neighbourhoods
+        }
+
+        city_children, location_children = {}, {}
+
+        for neighbourhood_id, (city_id, name) in self.neighbourhoods.items():
+            city_children.setdefault(city_id, []).append([neighbourhood_id, name])
+
+        for city_id, (location_id, name) in self.cities.items():
+            location_children.setdefault(location_id, []).append([city_id, name, city_children.get(city_id, [])])
+
+        payload = [
+            [location_id, name, location_children.get(location_id, [])]
+            for location_id, name in self.locations.items()
+        ]
+        self.json = json.dumps({'locations': payload}, separators=(',', ':'))
+        self.etag = hashlib.md5(self.json.encode(), usedforsecurity=False).hexdigest()
+
+    @property
+    def city_choices(self):
+        return [(f'CITY_{city_id}', name) for city_id, (_, name) in self.cities.items()]
+
+    def neighbourhood_hierarchy(self, neighbourhood_id):
+        city_id, neighbourhood_name = self.neighbourhoods[neighbourhood_id]
+        location_id, city_name = self.cities[city_id]
+
+        return {
+            'location': {'id': location_id, 'name': self.locations[location_id]},
+            'city': {'id': city_id, 'name': city_name},
+            'neighbourhood': {'id': neighbourhood_id, 'name': neighbourhood_name},
+        }
+
+
+def build_location_tree():
+    return LocationTree(
+        Location.objects.order_by('id').values_list('id', 'name'),
+        City.objects.order_by('id').values_list('id', 'location_id', 'name'),
+        Neighbourhood.objects.order_by('id').values_list('id', 'city_id', 'name'),
+    )
+
+
+location_tree_cache = VersionedCache('location-tree', build_location_tree)
+
+
+def get_location_tree():
+    return location_tree_cache.get()
+
+
+async def aget_location_tree():
+    return await location_tree_cache.aget()
+
+
+class PropertyFormSchema:
+    """
+    The property fields of one category as plain specs: [(prop_id, name, data_type, is_required, choices)].
+
+    Only the specs travel through the shared cache; ads.forms compiles them into a form class the first time a process
+    needs it and keeps that class on the schema until the next version.
+    """
+
+    def __init__(self, specs):
+        self.specs = specs
+        self.form_class = None
+
+    def __getstate__(self):
+        return {'specs': self.specs, 'form_class': None}
+
+    @property
+    def choice_property_ids(self):
+        return [prop_id for prop_id, _, data_type, _, _ in self.specs if data_type == DataType.CHOICE]
+
+
+def build_property_form_schema(category_id):
+    category_properties = (
+        CategoryProperty.objects.filter(category_id=category_id).select_related('property')
+        .prefetch_related('category_property_values').order_by('id')
+    )
+
+    return PropertyFormSchema([
+        (cp.property_id, cp.property.name, cp.property.data_type, cp.is_required,
+         [value.value for value in cp.category_property_values.all()])
+        for cp in category_properties
+    ])
+
+
+property_form_schema_cache = VersionedCache('property-form-schema', build_property_form_schema)
+
+
+def get_property_form_schema(category_id):
+    return property_form_schema_cache.get(int(category_id))
+
+
+async def aget_property_form_schema(category_id):
+    return await property_form_schema_cache.aget(int(category_id))
+
+
+def build_properties():
+    rows = Property.objects.values_list('id', 'name', 'data_type')
+    return {prop_id: (name, data_type) for prop_id, name, data_type in rows}
+
+
+properties_cache = VersionedCache('properties', build_properties)
+
+
+def get_properties():
+    """
+    Name and data type of every property by id
+    """
+    return properties_cache.get()
+
+
+def ad_namespace(ad_id):
+    return f'ad:{ad_id}'
+
+
+def owner_namespace(user_id):
+    return f'user:{user_id}'
+
+
+def get_ad_detail(ad_id, builder):
+    """
+    Return the rendered detail payload of one ad, calling builder(ad_id) only when the ad or its owner changed.
+
+    The payload is stored under the ad's version and remembers the owner version it was rendered with, so a hit costs
+    three cache reads and no queries. builder may raise Http404, which is not cached.
+    """
+    key = f'ad-detail:{ad_id}:{get_version(ad_namespace(ad_id))}'
+    detail = cache.get(key)
+
+    if detail is not None and detail['owner_version'] == get_version(owner_namespace(detail['owner_id'])):
+        return detail
+
+    # Read from the primary, or a lagging replica could pin the pre-edit ad to the new version
+    with use_primary():
+        detail = builder(ad_id)
+
+    cache.set(key, detail, getattr(settings, 'ADS_AD_DETAIL_CACHE_TIMEOUT', 60 * 60 * 24))
+    return detail
+
+
+def invalidate_ad_detail(ad_id):
+    bump_version(ad_namespace(ad_id))
+
+
+def invalidate_owner_details(user_id):
+    bump_version(owner_namespace(user_id))
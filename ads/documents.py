@@ -1,19 +1,80 @@
+from django.db.models import Prefetch
 from django_elasticsearch_dsl import Document, fields
 from django_elasticsearch_dsl.registries import registry
 
-from .models import Ad
+from .choices import DataType
+from .models import Ad, AdPropertyValue
 
 
 @registry.register_document
 class AdDocument(Document):
-    category = fields.ObjectField(properties={'id': fields.IntegerField(), 'name': fields.TextField()})
+    # path holds every ancestor id, so "all ads under a category" is a single term filter
+    category = fields.ObjectField(
+        properties={'id': fields.IntegerField(), 'name': fields.TextField(), 'path': fields.IntegerField()}
+    )
     neighbourhood = fields.ObjectField(
-        properties={'id': fields.IntegerField(), 'name': fields.TextField(), 'city_id': fields.IntegerField()}
+        properties={
+            'id': fields.IntegerField(), 'name': fields.TextField(), 'city_id': fields.IntegerField(),
+            'city': fields.ObjectField(properties={'id': fields.IntegerField(), 'name': fields.TextField()}),
+        }
+    )
+    # Only rendered by the list cards, never searched
+    thumbnail_url = fields.KeywordField(index=False)
+    thumbnail_srcset = fields.KeywordField(index=False)
+    thumbnail_webp_srcset = fields.KeywordField(index=False)
+    # One nested object per property value, typed by Property.data_type so filters can run as range/term queries
+    properties = fields.NestedField(
+        properties={
+            'prop_id': fields.IntegerField(), 'number': fields.DoubleField(), 'boolean': fields.BooleanField(),
+            'keyword': fields.KeywordField(),
+        }
     )
 
     class Index:
         name = 'ads'
 
+    # Autosync is off; ads.signals queues ads for indexing, related changes included
     class Django:
         model = Ad
         fields = ['id', 'title', 'description', 'price', 'created_at']
+
+    @property
+    def pk(self):
+        return self.meta.id
+
+    def get_queryset(self):
+        return super().get_queryset().select_related('category', 'neighbourhood__city').prefetch_related(
+            Prefetch('property_values', queryset=AdPropertyValue.objects.select_related('prop')),
+        )
+
+    def prepare_thumbnail_url(self, instance):
+        return instance.thumbnail_url
+
+    def prepare_thumbnail_srcset(self, instance):
+        return instance.thumbnail_srcset
+
+    def prepare_thumbnail_webp_srcset(self, instance):
+        return instance.thumbnail_webp_srcset
+
+    def prepare_properties(self, instance):
+        properties = []
+
+        for property_value in instance.property_values.all():
+            data_type = property_value.prop.data_type
+            item = {'prop_id': property_value.prop_id}
+
+            typed_value = property_value.typed_value
+
+            if typed_value is None:
+                continue
+
+            if data_type == DataType.NUMBER:
+                item['number'] = typed_value
+            elif data_type == DataType.BOOLEAN:
+                item['boolean'] = typed_value
+            else:
+                item['keyword'] = typed_value
+
+            properties.append(item)
+
+        return properties
@@ -1,10 +1,11 @@
 from django import forms
 from django.conf import settings
-from django.forms import ValidationError, inlineformset_factory
+from django.forms import BaseInlineFormSet, ValidationError, inlineformset_factory
 
 from accounts.models import Profile
+from ads.cache import get_category_tree
 from ads.choices import DataType
-from ads.models import Ad, AdImage, AdPropertyValue, Category, CategoryProperty, Neighbourhood
+from ads.models import Ad, AdImage, Category, Neighbourhood
 from core.forms.mixins import BootstrapWidgetMixin
 from core.validators import validate_phone
 
@@ -25,23 +26,55 @@ class AdForm(BootstrapWidgetMixin, forms.ModelForm):
         if not category:
             raise forms.ValidationError('Please select a category.')
 
-        if category.children.exists():
+        if not get_category_tree().is_leaf(category.id):
             raise forms.ValidationError('Please select a leaf category.')
 
         return category
 
 
+class UploadedImageField(forms.ImageField):
+    def to_python(self, data):
+        # Set by ImageUploadHandler when it refused the file while streaming it
+        upload_error = getattr(data, 'upload_error', None)
+
+        if upload_error:
+            raise ValidationError(upload_error, code='invalid_upload')
+
+        return super().to_python(data)
+
+
 class AdImageForm(BootstrapWidgetMixin, forms.ModelForm):
+    image = UploadedImageField()
+
     class Meta:
         model = AdImage
         fields = ['image']
 
 
+class BaseAdImageFormSet(BaseInlineFormSet):
+    def clean(self):
+        """
+        Check the per-ad image limit once for the whole submission instead of once per saved image
+        """
+        super().clean()
+
+        if any(self.errors):
+            return
+
+        max_images = getattr(settings, 'ADS_MAX_IMAGES_PER_AD', 20)
+        kept = sum(1 for form in self.initial_forms if not self._should_delete_form(form))
+        added = sum(1 for form in self.extra_forms if form.has_changed() and not self._should_delete_form(form))
+
+        if kept + added > max_images:
+            raise ValidationError(f'Maximum {max_images} images are allowed per Ad.')
+
+
 # Creates a ready-to-use inline formset class (parent–child relationship)
 AdImageCreateFormSet = inlineformset_factory(
     parent_model=Ad,
     model=AdImage,
     form=AdImageForm,
+    formset=BaseAdImageFormSet,
     fields=('image',),
     extra=2,
     can_delete=False,
@@ -54,6 +87,8 @@ AdImageCreateFormSet = inlineformset_factory(
 AdImageUpdateFormSet = inlineformset_factory(
     parent_model=Ad,
     model=AdImage,
+    form=AdImageForm,
+    formset=BaseAdImageFormSet,
     fields=('image',),
     extra=2,
     can_delete=True,
@@ -111,42 +146,59 @@ class ProfileInlineForm(BootstrapWidgetMixin, forms.ModelForm):
 
 
 class DynamicPropertyForm(BootstrapWidgetMixin, forms.Form):
+    """
+    Base of the per-category property forms compiled by property_form_class()
+    """
 
-    def __init__(self, *args, category=None, ad=None, **kwargs):
-        super().__init__(*args, **kwargs)
+    prop_ids = []
 
-        if not category:
-            return
 
-        existing_values = {}
-
-        if ad:
-            existing_values = {apv.prop_id: apv.value for apv in AdPropertyValue.objects.filter(ad=ad)}
-        category_properties = (
-            CategoryProperty.objects.filter(category=category).select_related('property')
-            .prefetch_related('category_property_values')
-        )
-        self.prop_ids = []
-
-        for cp in category_properties:
-            prop = cp.property
-            field_name = f'property_{prop.id}'
-            self.prop_ids.append(prop.id)
-
-            initial = None if self.is_bound else existing_values.get(prop.id)
-
-            if prop.data_type == DataType.TEXT:
-                field = forms.CharField(label=prop.name, required=cp.is_required, initial=initial)
-            elif prop.data_type == DataType.NUMBER:
-                field = forms.IntegerField(label=prop.name, required=cp.is_required,
-                                           initial=int(initial) if initial not in (None, '') else None)
-            elif prop.data_type == DataType.BOOLEAN:
-                field = forms.BooleanField(label=prop.name, required=False, initial=initial in ('True', 'true', True))
-            elif prop.data_type == DataType.CHOICE:
-                choices = [('', '---------')]
-                choices += [(v.value, v.value) for v in cp.category_property_values.all()]
-                field = forms.ChoiceField(label=prop.name, choices=choices, required=cp.is_required , initial=initial)
-
-            self.fields[field_name] = field
-
-        self.apply_bootstrap()
+def build_property_field(name, data_type, is_required, choices):
+    if data_type == DataType.NUMBER:
+        return forms.IntegerField(label=name, required=is_required)
+
+    if data_type == DataType.BOOLEAN:
+        return forms.BooleanField(label=name, required=False)
+
+    if data_type == DataType.CHOICE:
+        choices = [('', '---------')] + [(value, value) for value in choices]
+        return forms.ChoiceField(label=name, choices=choices, required=is_required)
+
+    return forms.CharField(label=name, required=is_required)
+
+
+def property_form_class(schema):
+    """
+    The DynamicPropertyForm subclass for a PropertyFormSchema, compiled once per process and schema version. Each
+    instance then starts from a deep copy of its base_fields, like any declarative form.
+    """
+    if schema.form_class is None:
+        fields = {f'property_{prop_id}': build_property_field(*spec) for prop_id, *spec in schema.specs}
+        fields['prop_ids'] = [prop_id for prop_id, *_ in schema.specs]
+        schema.form_class = type('CategoryPropertyForm', (DynamicPropertyForm,), fields)
+
+    return schema.form_class
+
+
+def build_property_form(schema, data=None, values=None):
+    """
+    Property form for a category's schema, or an empty one without a category. values are the stored
+    {prop_id: value} of the ad being edited and only fill an unbound form.
+    """
+    if schema is None:
+        return DynamicPropertyForm(data)
+
+    initial = {}
+
+    if values and data is None:
+        for prop_id, _, data_type, _, _ in schema.specs:
+            value = values.get(prop_id)
+
+            if data_type == DataType.NUMBER:
+                value = int(value) if value not in (None, '') else None
+            elif data_type == DataType.BOOLEAN:
+                value = value in ('True', 'true')
+
+            initial[f'property_{prop_id}'] = value
+
+    return property_form_class(schema)(data, initial=initial)
@@ -0,0 +1,83 @@
+import operator
+from functools import reduce
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from elasticsearch.helpers import bulk
+
+from ads.documents import AdDocument
+from ads.models import AdIndexQueue
+
+
+REBUILD_INDEX_KEY = 'ads-index:rebuilding'
+
+
+def get_rebuild_index():
+    """
+    Name of the index rebuild_ads_index is loading, or None; queue batches are written to it as well
+    """
+    return cache.get(REBUILD_INDEX_KEY)
+
+
+def set_rebuild_index(index_name):
+    if index_name is None:
+        cache.delete(REBUILD_INDEX_KEY)
+    else:
+        cache.set(REBUILD_INDEX_KEY, index_name, None)
+
+
+def enqueue_ads(ad_ids):
+    entries = [AdIndexQueue(ad_id=ad_id) for ad_id in set(ad_ids)]
+
+    # Re-queuing an ad that is already waiting only moves its queued_at forward
+    AdIndexQueue.objects.bulk_create(
+        entries, batch_size=1000, update_conflicts=True, unique_fields=['ad_id'], update_fields=['queued_at']
+    )
+
+
+def enqueue_ads_on_commit(get_ad_ids):
+    """
+    Queue ads for indexing once the surrounding transaction commits, so a rolled back write never reaches the index.
+    get_ad_ids is called after the commit, which keeps large related lookups off the request.
+    """
+    transaction.on_commit(lambda: enqueue_ads(get_ad_ids()))
+
+
+def process_index_queue(batch_size=None):
+    """
+    Index or remove one batch of queued ads with a single bulk request, returning the number of ads handled
+    """
+    batch_size = batch_size or getattr(settings, 'ADS_INDEX_BATCH_SIZE', 500)
+    entries = list(AdIndexQueue.objects.order_by('queued_at')[:batch_size])
+
+    if not entries:
+        return 0
+
+    document = AdDocument()
+    ad_ids = {entry.ad_id for entry in entries}
+    ads = list(document.get_queryset().filter(id__in=ad_ids))
+    missing_ids = ad_ids - {ad.pk for ad in ads}
+
+    actions = [document._prepare_action(ad, 'index') for ad in ads]
+    actions += [{'_op_type': 'delete', '_index': document._index._name, '_id': ad_id} for ad_id in missing_ids]
+    rebuild_index = get_rebuild_index()
+
+    if rebuild_index:
+        # The alias still points at the old index, so changes made during a rebuild are applied to the new one too
+        actions += [{**action, '_index': rebuild_index} for action in actions]
+
+    _, errors = bulk(document._get_connection(), actions, raise_on_error=False, raise_on_exception=True)
+    # Deleting an ad that never made it into the index is not a failure
+    errors = [error for error in errors if error.get('delete', {}).get('status') != 404]
+
+    if errors:
+        raise RuntimeError(f'{len(errors)} ads failed to index, first error: {errors[0]}')
+
+    # Entries queued again while this batch was in flight keep their row and are picked up by the next batch
+    AdIndexQueue.objects.filter(
+        reduce(operator.or_, (Q(pk=entry.pk, queued_at=entry.queued_at) for entry in entries))
+    ).delete()
+
+    return len(entries)
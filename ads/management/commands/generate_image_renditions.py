@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ads.renditions import generate_pending_renditions
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnail, detail and WebP renditions for uploaded ad images using a process pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help='Images rendered per batch.')
+        parser.add_argument('--workers', type=int, default=None, help='Worker processes (defaults to CPU count).')
+        parser.add_argument('--once', action='store_true', help='Render what is pending and exit instead of polling.')
+        parser.add_argument('--sleep', type=float, default=2.0, help='Seconds to wait when nothing is pending.')
+
+    def handle(self, *args, **options):
+        while True:
+            processed = generate_pending_renditions(options['batch_size'], options['workers'])
+
+            if processed:
+                self.stdout.write(f'Rendered {processed} images.')
+                continue
+
+            if options['once']:
+                return
+
+            time.sleep(options['sleep'])
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ads.indexing import process_index_queue
+
+
+class Command(BaseCommand):
+    help = 'Drain the ad index queue into Elasticsearch using bulk requests.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Ads per bulk request.')
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit instead of polling.')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when the queue is empty.')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                processed = process_index_queue(options['batch_size'])
+            except Exception as e:
+                # A failed batch keeps its queue rows and is retried on the next pass
+                self.stderr.write(f'Index batch failed: {e}')
+                processed = 0
+
+                if options['once']:
+                    raise
+
+            if processed:
+                self.stdout.write(f'Indexed {processed} ads.')
+                continue
+
+            if options['once']:
+                return
+
+            time.sleep(options['sleep'])
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ads.models import Ad
+
+
+class Command(BaseCommand):
+    help = 'Hard-delete soft-deleted ads, with their images and property values, a chunk per transaction.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=100, help='Ads deleted per transaction.')
+        parser.add_argument('--sleep', type=float, default=0.5, help='Seconds to pause between chunks.')
+
+    def handle(self, *args, **options):
+        purged = 0
+
+        while True:
+            deleted = Ad.all_objects.filter(is_deleted=True).order_by('pk')
+            ad_ids = list(deleted.values_list('pk', flat=True)[:options['chunk_size']])
+
+            if not ad_ids:
+                break
+
+            # Short transactions keep the cascade from holding locks on a large set of rows at once
+            with transaction.atomic():
+                Ad.all_objects.filter(pk__in=ad_ids, is_deleted=True).delete()
+
+            purged += len(ad_ids)
+            self.stdout.write(f'Purged {purged} ads.')
+            time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f'Done, {purged} ads purged.'))
@@ -0,0 +1,199 @@
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from elasticsearch import Elasticsearch
+from elasticsearch.helpers import bulk
+
+from ads.documents import AdDocument
+from ads.indexing import enqueue_ads, set_rebuild_index
+from ads.models import Ad
+from core.utils import close_connections_before_fork
+
+
+def index_chunk(index_name, start, end, fetch_size):
+    """
+    Stream one primary-key range of ads into index_name. Runs in a worker process with its own connections.
+
+    Documents are only created, never overwritten: one the index queue already wrote during the rebuild is newer
+    than the row read here. Ads deleted while the chunk was in flight are removed again afterwards.
+    """
+    document = AdDocument()
+    client = Elasticsearch(**settings.ELASTICSEARCH_DSL['default'])
+    queryset = document.get_queryset().filter(pk__gte=start, pk__lt=end).order_by('pk')
+    loaded_ids = []
+
+    def actions():
+        # iterator() reads through a server-side cursor, so a chunk never sits in memory as a whole
+        for ad in queryset.iterator(chunk_size=fetch_size):
+            loaded_ids.append(ad.pk)
+            yield {'_op_type': 'create', '_index': index_name, '_id': ad.pk, '_source': document.prepare(ad)}
+
+    indexed, errors = bulk(client, actions(), chunk_size=fetch_size, raise_on_error=False)
+    errors = [error for error in errors if error.get('create', {}).get('status') != 409]
+
+    if errors:
+        raise RuntimeError(f'{len(errors)} ads failed to index, first error: {errors[0]}')
+
+    # A delete applied by the queue before its row was written here would otherwise be undone
+    gone_ids = set(loaded_ids) - set(Ad.objects.filter(pk__in=loaded_ids).values_list('pk', flat=True))
+    bulk(
+        client, ({'_op_type': 'delete', '_index': index_name, '_id': ad_id} for ad_id in gone_ids),
+        raise_on_error=False,
+    )
+    client.close()
+    return indexed
+
+
+class Command(BaseCommand):
+    help = (
+        'Build a new versioned ads index in parallel and swap the alias to it without taking search down. '
+        'While the load runs, the index queue writes every change to the new index as well, so edits and deletes '
+        'made during the rebuild are not lost. Queue workers must share the cache this command uses.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+        parser.add_argument('--chunk-size', type=int, default=20000, help='Primary keys per worker chunk.')
+        parser.add_argument('--fetch-size', type=int, default=1000, help='Rows per cursor fetch and bulk request.')
+        parser.add_argument('--replicas', type=int, default=1, help='Replicas to restore once the load is done.')
+        parser.add_argument('--keep-old', action='store_true', help='Do not delete the previous index.')
+        parser.add_argument(
+            '--state-file', default=os.path.join(tempfile.gettempdir(), 'offmarket_ads_reindex.json'),
+            help='Progress file used to resume an interrupted rebuild.'
+        )
+
+    def handle(self, *args, **options):
+        self.client = AdDocument._get_connection()
+        self.alias = AdDocument._index._name
+        self.state_file = options['state_file']
+
+        state = self.load_state()
+
+        if state is None:
+            state = self.start_rebuild(options)
+        else:
+            self.stdout.write(f'Resuming {state["index"]}: {len(state["completed"])} chunks already done.')
+
+        # From here on the index queue also applies changes to the new index
+        set_rebuild_index(state['index'])
+
+        self.load(state, options)
+        self.finish(state, options)
+
+    def load_state(self):
+        if not os.path.exists(self.state_file):
+            return None
+
+        with open(self.state_file) as f:
+            state = json.load(f)
+
+        if not self.client.indices.exists(index=state['index']):
+            set_rebuild_index(None)
+            raise CommandError(f'{state["index"]} from {self.state_file} no longer exists; remove the file.')
+
+        return state
+
+    def save_state(self, state):
+        tmp_path = f'{self.state_file}.tmp'
+
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+
+        os.replace(tmp_path, self.state_file)
+
+    def start_rebuild(self, options):
+        existing = self.client.indices.get(index=f'{self.alias}_v*', ignore_unavailable=True, allow_no_indices=True)
+        versions = [int(name.rsplit('_v', 1)[1]) for name in existing if name.rsplit('_v', 1)[1].isdigit()]
+        index_name = f'{self.alias}_v{max(versions, default=0) + 1}'
+
+        index = AdDocument._index.clone(name=index_name)
+        # Nothing searches the new index until the alias moves, so skip refreshes and replica copies while loading
+        index.settings(number_of_replicas=0, refresh_interval='-1')
+        index.create()
+
+        bounds = Ad.objects.aggregate(first=Min('pk'), last=Max('pk'))
+        state = {
+            'index': index_name,
+            'first_pk': bounds['first'] or 0,
+            'last_pk': bounds['last'] or 0,
+            'chunk_size': options['chunk_size'],
+            'completed': [],
+            'indexed': 0,
+        }
+        self.save_state(state)
+        self.stdout.write(f'Created {index_name}.')
+        return state
+
+    def load(self, state, options):
+        chunk_size = state['chunk_size']
+        chunks = [
+            start for start in range(state['first_pk'], state['last_pk'] + 1, chunk_size)
+            if start not in state['completed']
+        ]
+
+        if not chunks:
+            return
+
+        # Forked workers must open their own database connections instead of sharing the parent's socket
+        close_connections_before_fork()
+        started = time.monotonic()
+        indexed = 0
+
+        with ProcessPoolExecutor(options['workers'], mp_context=multiprocessing.get_context('fork')) as executor:
+            futures = {
+                executor.submit(index_chunk, state['index'], start, start + chunk_size, options['fetch_size']): start
+                for start in chunks
+            }
+
+            for future in as_completed(futures):
+                count = future.result()
+                indexed += count
+                state['completed'].append(futures[future])
+                state['indexed'] += count
+                self.save_state(state)
+
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'{len(state["completed"])} chunks done, {state["indexed"]} docs, '
+                    f'{indexed / elapsed if elapsed else 0:.0f} docs/sec'
+                )
+
+    def finish(self, state, options):
+        index_name = state['index']
+
+        self.client.indices.put_settings(
+            index=index_name, settings={'index': {'number_of_replicas': options['replicas'], 'refresh_interval': None}}
+        )
+        self.client.indices.refresh(index=index_name)
+
+        old_indices = []
+        actions = []
+
+        if self.client.indices.exists_alias(name=self.alias):
+            old_indices = list(self.client.indices.get_alias(name=self.alias))
+            actions = [{'remove': {'index': name, 'alias': self.alias}} for name in old_indices]
+        elif self.client.indices.exists(index=self.alias):
+            # A concrete index still named like the alias (the pre-alias layout) is dropped in the same atomic swap
+            actions.append({'remove_index': {'index': self.alias}})
+
+        actions.append({'add': {'index': index_name, 'alias': self.alias}})
+        self.client.indices.update_aliases(actions=actions)
+        set_rebuild_index(None)
+        self.stdout.write(f'Alias {self.alias} now points to {index_name}.')
+
+        if not options['keep_old']:
+            for name in old_indices:
+                if name != index_name:
+                    self.client.indices.delete(index=name)
+                    self.stdout.write(f'Deleted {name}.')
+
+        enqueue_ads(Ad.objects.filter(pk__gt=state['last_pk']).values_list('pk', flat=True))
+        os.remove(self.state_file)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {index_name} with {state["indexed"]} documents.'))
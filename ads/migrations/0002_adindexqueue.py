@@ -0,0 +1,38 @@
+# Generated by Django 6.0.1 on 2026-10-17 09:12
+
+import django.db.models.functions.datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ads", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AdIndexQueue",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("ad_id", models.PositiveBigIntegerField(unique=True)),
+                (
+                    "queued_at",
+                    models.DateTimeField(
+                        db_default=django.db.models.functions.datetime.Now()
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "Ad Index Queue",
+            },
+        ),
+    ]
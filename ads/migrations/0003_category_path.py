@@ -0,0 +1,61 @@
+# Generated by Django 6.0.1 on 2026-10-17 10:03
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+def populate_category_paths(apps, schema_editor):
+    Category = apps.get_model('ads', 'Category')
+    parents = dict(Category.objects.values_list('id', 'parent_id'))
+    paths = {}
+
+    def build_path(category_id):
+        chain = []
+
+        while category_id is not None and category_id not in paths:
+            chain.append(category_id)
+            category_id = parents.get(category_id)
+
+        path = paths.get(category_id, [])
+
+        for node_id in reversed(chain):
+            path = [*path, node_id]
+            paths[node_id] = path
+
+        return paths[chain[0]] if chain else path
+
+    categories = list(Category.objects.all())
+
+    for category in categories:
+        category.path = build_path(category.id)
+
+    Category.objects.bulk_update(categories, ['path'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ads", "0002_adindexqueue"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="category",
+            name="path",
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.BigIntegerField(),
+                blank=True,
+                default=list,
+                editable=False,
+                size=None,
+            ),
+        ),
+        migrations.RunPython(populate_category_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="category",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["path"], name="ads_category_path_gin"
+            ),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 6.0.1 on 2026-10-17 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ads", "0003_category_path"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="adimage",
+            name="renditions",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="adimage",
+            index=models.Index(
+                condition=models.Q(("renditions", {})),
+                fields=["id"],
+                name="ads_adimage_pending_renditions",
+            ),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 6.0.1 on 2026-10-17 12:02
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_image_counts(apps, schema_editor):
+    Ad = apps.get_model('ads', 'Ad')
+    AdImage = apps.get_model('ads', 'AdImage')
+    counts = AdImage.objects.filter(ad=OuterRef('pk')).order_by().values('ad').annotate(total=Count('id'))
+
+    Ad.objects.update(image_count=Coalesce(Subquery(counts.values('total')), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ads", "0004_adimage_renditions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ad",
+            name="image_count",
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_image_counts, migrations.RunPython.noop),
+    ]
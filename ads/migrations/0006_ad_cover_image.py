@@ -0,0 +1,51 @@
+# Generated by Django 6.0.1 on 2026-10-17 13:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import JSONField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_cover_images(apps, schema_editor):
+    Ad = apps.get_model('ads', 'Ad')
+    AdImage = apps.get_model('ads', 'AdImage')
+    first_image = AdImage.objects.filter(ad=OuterRef('pk')).order_by('id')
+
+    Ad.objects.filter(image_count__gt=0).update(
+        cover_image=Subquery(first_image.values('id')[:1]),
+        cover_image_path=Coalesce(Subquery(first_image.values('image')[:1]), Value('')),
+        cover_renditions=Coalesce(Subquery(first_image.values('renditions')[:1]), Value({}, output_field=JSONField())),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ads", "0005_ad_image_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ad",
+            name="cover_image",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="ads.adimage",
+            ),
+        ),
+        migrations.AddField(
+            model_name="ad",
+            name="cover_image_path",
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="ad",
+            name="cover_renditions",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(populate_cover_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 6.0.1 on 2026-10-17 15:40
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def populate_search_vectors(apps, schema_editor):
+    Ad = apps.get_model('ads', 'Ad')
+    Category = apps.get_model('ads', 'Category')
+    category_name = Subquery(Category.objects.filter(pk=OuterRef('category_id')).values('name')[:1])
+
+    Ad.objects.update(search_vector=(
+        SearchVector('title', weight='A', config='simple')
+        + SearchVector('description', weight='B', config='simple')
+        + SearchVector(category_name, weight='C', config='simple')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ads", "0006_ad_cover_image"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name="ad",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(populate_search_vectors, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="ad",
+            index=django.contrib.postgres.indexes.GinIndex(fields=["search_vector"], name="ads_ad_search_vector_gin"),
+        ),
+        migrations.AddIndex(
+            model_name="ad",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["title"], name="ads_ad_title_trgm", opclasses=["gin_trgm_ops"]
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0.1 on 2026-10-17 16:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ads", "0007_ad_search_vector"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="ad",
+            index=models.Index(fields=["created_at", "id"], name="ads_ad_created_at_id"),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 6.0.1 on 2026-10-17 17:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ads", "0008_ad_created_at_id_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="ad",
+            name="ads_ad_created_at_id",
+        ),
+        migrations.AddIndex(
+            model_name="ad",
+            index=models.Index(
+                condition=models.Q(("is_deleted", False)), fields=["created_at", "id"], name="ads_ad_live_created_at_id"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="ad",
+            index=models.Index(condition=models.Q(("is_deleted", False)), fields=["user"], name="ads_ad_live_user"),
+        ),
+        migrations.AddIndex(
+            model_name="ad",
+            index=models.Index(
+                condition=models.Q(("is_deleted", False)), fields=["category"], name="ads_ad_live_category"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="adimage",
+            index=models.Index(
+                condition=models.Q(("is_deleted", False)), fields=["ad", "id"], name="ads_adimage_live_ad_id"
+            ),
+        ),
+        # The partial indexes above replace the full foreign key indexes
+        migrations.AlterField(
+            model_name="ad",
+            name="user",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="ads",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="ad",
+            name="category",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="ads",
+                to="ads.category",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="adimage",
+            name="ad",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="images",
+                to="ads.ad",
+            ),
+        ),
+    ]
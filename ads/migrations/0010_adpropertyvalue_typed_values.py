@@ -0,0 +1,59 @@
+# Generated by Django 6.0.1 on 2026-10-17 17:50
+
+from django.db import migrations, models
+from django.db.models.functions import Cast, Substr
+
+
+NUMBER_PATTERN = r'^\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*$'
+
+
+def populate_typed_values(apps, schema_editor):
+    AdPropertyValue = apps.get_model('ads', 'AdPropertyValue')
+    values = AdPropertyValue.objects.all()
+
+    # Unparseable numbers keep value_num NULL, as set_typed_values() leaves them
+    values.filter(prop__data_type='number', value__regex=NUMBER_PATTERN).update(
+        value_num=Cast('value', models.FloatField())
+    )
+    values.filter(prop__data_type='bool').update(value_bool=False)
+    values.filter(prop__data_type='bool', value__iregex=r'^(true|1|yes)$').update(value_bool=True)
+    values.filter(prop__data_type__in=['text', 'choice']).update(value_text=Substr('value', 1, 255))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ads", "0009_soft_delete_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="adpropertyvalue",
+            name="value",
+            field=models.TextField(),
+        ),
+        migrations.AddField(
+            model_name="adpropertyvalue",
+            name="value_num",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="adpropertyvalue",
+            name="value_bool",
+            field=models.BooleanField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="adpropertyvalue",
+            name="value_text",
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.RunPython(populate_typed_values, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="adpropertyvalue",
+            index=models.Index(fields=["prop", "value_num"], name="ads_adpropvalue_prop_num"),
+        ),
+        migrations.AddIndex(
+            model_name="adpropertyvalue",
+            index=models.Index(fields=["prop", "value_text"], name="ads_adpropvalue_prop_text"),
+        ),
+    ]
@@ -1,13 +1,40 @@
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Now
 from django.forms import ValidationError
 
 from ads.choices import DataType
-from core.models.base import BaseModel
+from core.models.base import BaseModel, SoftDeleteManager, SoftDeleteQuerySet
 from core.utils import ad_image_upload_to, category_image_upload_to, get_file_extension
 
 
+# Partial index condition for lookups that only ever see rows the default manager returns
+LIVE = models.Q(is_deleted=False)
+
+
+def rendition_url(storage, renditions, name, image_format='jpeg'):
+    path = renditions.get(name, {}).get(image_format)
+    return storage.url(path) if path else ''
+
+
+def rendition_srcset(storage, renditions, names, image_format='jpeg'):
+    specs = getattr(settings, 'ADS_IMAGE_RENDITIONS', {})
+    candidates = []
+
+    for name in names:
+        url = rendition_url(storage, renditions, name, image_format)
+
+        if url and name in specs:
+            candidates.append(f'{url} {specs[name]["size"][0]}w')
+
+    return ', '.join(candidates)
+
+
 class Category(BaseModel):
     name = models.CharField(max_length=96)
     parent = models.ForeignKey(
@@ -15,9 +42,12 @@ class Category(BaseModel):
     )
     image = models.ImageField(upload_to=category_image_upload_to, null=True, blank=True)
     is_active = models.BooleanField(default=True)
+    # Materialized path of ids from the root down to this category, maintained on save
+    path = ArrayField(models.BigIntegerField(), default=list, blank=True, editable=False)
 
     class Meta:
         verbose_name_plural = 'Categories'
+        indexes = [GinIndex(fields=['path'], name='ads_category_path_gin')]
 
     @property
     def has_parent(self):
@@ -25,31 +55,49 @@ class Category(BaseModel):
 
     @property
     def get_hierarchy(self):
-        current = self
-        hierarchy = []
+        names = dict(Category.objects.filter(id__in=self.path).values_list('id', 'name'))
+        return [{'id': category_id, 'name': names[category_id]} for category_id in self.path if category_id in names]
 
-        while current:
-            hierarchy.append({'id': current.id, 'name': current.name})
-            current = current.parent
-
-        hierarchy.reverse()
-        return hierarchy
+    def get_descendants(self, include_self=True):
+        """Every category in this subtree, as a single indexed path predicate"""
+        queryset = Category.objects.filter(path__contains=[self.pk])
+        return queryset if include_self else queryset.exclude(pk=self.pk)
 
     def clean(self):
         if self.parent and self.pk and self.parent_id == self.pk:
             raise ValidationError('Category cannot be parent of itself.')
 
-        parent = self.parent
-
-        while parent:
-            if parent == self:
-                raise ValidationError('Circular category hierarchy is not allowed.')
-            parent = parent.parent
+        if self.parent and self.pk and self.pk in self.parent.path:
+            raise ValidationError('Circular category hierarchy is not allowed.')
 
     def save(self, *args, **kwargs):
         self.full_clean()
         super().save(*args, **kwargs)
 
+        parent_path = []
+
+        if self.parent_id:
+            parent_path = Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).first() or []
+
+        old_path, new_path = list(self.path), [*parent_path, self.pk]
+
+        if new_path == old_path:
+            return
+
+        Category.objects.filter(pk=self.pk).update(path=new_path)
+        self.path = new_path
+
+        if not old_path:
+            return
+
+        # Moved: re-root every descendant path under the new one
+        descendants = list(self.get_descendants(include_self=False))
+
+        for descendant in descendants:
+            descendant.path = new_path + descendant.path[descendant.path.index(self.pk) + 1:]
+
+        Category.objects.bulk_update(descendants, ['path'], batch_size=500)
+
     def __str__(self):
         return self.name
 
@@ -76,43 +124,152 @@ class Neighbourhood(BaseModel):
     name = models.CharField(max_length=48)
 
     def get_location_hierarchy(self):
-        return {
-            'location': {
-                'id': self.city.location_id,
-                'name': self.city.location.name,
-            },
-            'city': {
-                'id': self.city_id,
-                'name': self.city.name,
-            },
-            'neighbourhood': {
-                'id': self.id,
-                'name': self.name,
-            }
-        }
+        # Imported here because the cache module builds its trees from these models
+        from ads.cache import get_location_tree
+
+        return get_location_tree().neighbourhood_hierarchy(self.id)
 
     def __str__(self):
         return self.name
 
 
+class AdQuerySet(SoftDeleteQuerySet):
+    def with_property(self, prop_id, data_type, value=None, min_value=None, max_value=None):
+        """
+        Ads whose value for prop_id equals value and/or lies within [min_value, max_value], compared in the typed
+        column for data_type so the (prop, value) indexes apply
+        """
+        column = {DataType.NUMBER: 'value_num', DataType.BOOLEAN: 'value_bool'}.get(data_type, 'value_text')
+        conditions = {'prop_id': prop_id}
+
+        if value is not None:
+            conditions[column] = value
+        if min_value is not None:
+            conditions[f'{column}__gte'] = min_value
+        if max_value is not None:
+            conditions[f'{column}__lte'] = max_value
+
+        return self.filter(pk__in=AdPropertyValue.objects.filter(**conditions).values('ad_id'))
+
+
 class Ad(BaseModel):
-    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, related_name='ads')
+    # user and category are indexed by the partial live-row indexes in Meta only
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, related_name='ads', db_index=False)
     # Linked to the deepest (leaf) category only
-    category = models.ForeignKey(Category, on_delete=models.PROTECT, related_name='ads')
+    category = models.ForeignKey(Category, on_delete=models.PROTECT, related_name='ads', db_index=False)
     title = models.CharField(max_length=80)
     description = models.TextField(max_length=4096)
     # Linked to the deepest (leaf) neighbourhood only
     neighbourhood = models.ForeignKey(Neighbourhood, on_delete=models.PROTECT)
     price = models.PositiveBigIntegerField()
     show_phone_number = models.BooleanField(default=True)
+    # Maintained with F() updates as images are added and deleted, see ads.signals
+    image_count = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    # Denormalized oldest image, so list cards render without loading the images; kept in sync by ads.signals
+    cover_image = models.ForeignKey(
+        'AdImage', null=True, blank=True, on_delete=models.SET_NULL, related_name='+', editable=False
+    )
+    cover_image_path = models.CharField(max_length=255, blank=True, editable=False)
+    cover_renditions = models.JSONField(default=dict, blank=True, editable=False)
+    # Weighted title, description and category name for the Postgres search backend, see ad_search_vector()
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = SoftDeleteManager.from_queryset(AdQuerySet)()
+    all_objects = models.Manager.from_queryset(AdQuerySet)()
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='ads_ad_search_vector_gin'),
+            GinIndex(fields=['title'], opclasses=['gin_trgm_ops'], name='ads_ad_title_trgm'),
+            # Keyset pagination of the feed seeks on (created_at, id)
+            models.Index(fields=['created_at', 'id'], name='ads_ad_live_created_at_id', condition=LIVE),
+            models.Index(fields=['user'], name='ads_ad_live_user', condition=LIVE),
+            models.Index(fields=['category'], name='ads_ad_live_category', condition=LIVE),
+        ]
+
+    @property
+    def cover_storage(self):
+        return AdImage._meta.get_field('image').storage
+
+    @property
+    def thumbnail_url(self):
+        if not self.cover_image_path:
+            return ''
+
+        return (rendition_url(self.cover_storage, self.cover_renditions, 'card')
+                or self.cover_storage.url(self.cover_image_path))
+
+    @property
+    def thumbnail_srcset(self):
+        return rendition_srcset(self.cover_storage, self.cover_renditions, ['card', 'card_2x'])
+
+    @property
+    def thumbnail_webp_srcset(self):
+        return rendition_srcset(self.cover_storage, self.cover_renditions, ['card', 'card_2x'], 'webp')
 
     def __str__(self):
         return self.title
 
 
+def ad_search_vector():
+    """
+    Update expression for Ad.search_vector. The category name comes from a subquery, since an UPDATE cannot join.
+    """
+    category_name = Subquery(Category.objects.filter(pk=OuterRef('category_id')).values('name')[:1])
+
+    return (
+        SearchVector('title', weight='A', config='simple')
+        + SearchVector('description', weight='B', config='simple')
+        + SearchVector(category_name, weight='C', config='simple')
+    )
+
+
 class AdImage(BaseModel):
-    ad = models.ForeignKey(Ad, on_delete=models.CASCADE, related_name='images')
+    # Indexed by ads_adimage_live_ad_id only
+    ad = models.ForeignKey(Ad, on_delete=models.CASCADE, related_name='images', db_index=False)
     image = models.ImageField(upload_to=ad_image_upload_to)
+    # Derived sizes written by the generate_image_renditions worker: {name: {format: storage path}}
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], name='ads_adimage_pending_renditions', condition=models.Q(renditions={})),
+            models.Index(fields=['ad', 'id'], name='ads_adimage_live_ad_id', condition=LIVE),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_image_name = values[field_names.index('image')] if 'image' in field_names else None
+        return instance
+
+    def rendition_url(self, name, image_format='jpeg'):
+        return rendition_url(self.image.storage, self.renditions, name, image_format)
+
+    def rendition_srcset(self, names, image_format='jpeg'):
+        return rendition_srcset(self.image.storage, self.renditions, names, image_format)
+
+    @property
+    def card_url(self):
+        # The original stays in use until the worker has produced the rendition
+        return self.rendition_url('card') or self.image.url
+
+    @property
+    def card_srcset(self):
+        return self.rendition_srcset(['card', 'card_2x'])
+
+    @property
+    def card_webp_srcset(self):
+        return self.rendition_srcset(['card', 'card_2x'], 'webp')
+
+    @property
+    def detail_url(self):
+        return self.rendition_url('detail') or self.image.url
+
+    @property
+    def detail_webp_url(self):
+        return self.rendition_url('detail', 'webp')
 
     def clean(self):
         """
@@ -121,8 +278,9 @@ class AdImage(BaseModel):
         max_images = getattr(settings, 'ADS_MAX_IMAGES_PER_AD', 20)
         max_size_mb = getattr(settings, 'ADS_MAX_IMAGE_SIZE_MB', 5)
 
-        if self.ad and self.pk:
-            if self.ad.images.count() >= max_images:
+        # Reads the maintained counter instead of counting rows; formsets check the whole submission at once
+        if self.ad and self._state.adding:
+            if self.ad.image_count >= max_images:
                 raise ValidationError(
                     f'Maximum {max_images} images are allowed per Ad.'
                 )
@@ -151,8 +309,15 @@ class AdImage(BaseModel):
         Enforce validations everywhere
         Manually trigger the complete validation process
         """
-        self.full_clean()
+        # An ad already attached in memory (as formsets do) needs no existence query
+        self.full_clean(exclude=['ad'] if AdImage.ad.is_cached(self) else None)
+
+        # A replaced upload needs its renditions generated again
+        if self.pk and self.image.name != getattr(self, '_loaded_image_name', self.image.name):
+            self.renditions = {}
+
         super().save(*args, **kwargs)
+        self._loaded_image_name = self.image.name
 
 
 class Property(BaseModel):
@@ -199,25 +364,69 @@ class CategoryPropertyValue(BaseModel):
 class AdPropertyValue(BaseModel):
     ad = models.ForeignKey(Ad, on_delete=models.CASCADE, related_name='property_values')
     prop = models.ForeignKey(Property, on_delete=models.CASCADE)
-    value = models.TextField(db_index=True)
+    # As entered; the typed columns below hold the parsed value in the column matching prop.data_type
+    value = models.TextField()
+    value_num = models.FloatField(null=True, blank=True, editable=False)
+    value_bool = models.BooleanField(null=True, blank=True, editable=False)
+    value_text = models.CharField(max_length=255, null=True, blank=True, editable=False)
 
     class Meta:
         unique_together = ('ad', 'prop',)
+        indexes = [
+            models.Index(fields=['prop', 'value_num'], name='ads_adpropvalue_prop_num'),
+            models.Index(fields=['prop', 'value_text'], name='ads_adpropvalue_prop_text'),
+        ]
 
     def __str__(self):
         return f'{self.ad.title} -> {self.prop.name}: {self.value}'
 
-    @property
-    def typed_value(self):
-        """Return the value in its proper type"""
+    def set_typed_values(self):
+        """
+        Fill the typed column for prop.data_type from value. Call it before bulk_create(), which skips save().
+        """
         dtype = self.prop.data_type
+        self.value_num = self.value_bool = self.value_text = None
+
         if dtype == DataType.NUMBER:
             try:
-                return int(self.value)
+                self.value_num = float(self.value)
             except ValueError:
-                return float(self.value)
+                pass
         elif dtype == DataType.BOOLEAN:
-            return self.value.lower() in ('true', '1', 'yes')
+            self.value_bool = self.value.lower() in ('true', '1', 'yes')
+        else:
+            # text/choice
+            self.value_text = self.value[:255]
+
+    def save(self, *args, **kwargs):
+        self.set_typed_values()
+        super().save(*args, **kwargs)
+
+    @property
+    def typed_value(self):
+        """Return the value in its proper type, None for a number that did not parse"""
+        dtype = self.prop.data_type
+        if dtype == DataType.NUMBER:
+            if self.value_num is not None and self.value_num.is_integer():
+                return int(self.value_num)
+            return self.value_num
+        elif dtype == DataType.BOOLEAN:
+            return self.value_bool
         else:
             # text/choice
             return self.value
+
+
+class AdIndexQueue(models.Model):
+    """
+    Ads waiting to be written to (or removed from) the search index, one row per ad
+    """
+    ad_id = models.PositiveBigIntegerField(unique=True)
+    # Database clock, so a worker can tell whether an ad was queued again while its batch was in flight
+    queued_at = models.DateTimeField(db_default=Now())
+
+    class Meta:
+        verbose_name_plural = 'Ad Index Queue'
+
+    def __str__(self):
+        return f'Ad {self.ad_id}'
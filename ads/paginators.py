@@ -0,0 +1,325 @@
+import base64
+import hashlib
+import inspect
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from ads.search import SearchResult, get_async_client
+from core.cache import aget_or_refresh, get_or_refresh
+from core.utils import count_rows
+
+
+def encode_cursor(data):
+    raw = json.dumps(data, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (TypeError, ValueError):
+        return None
+
+
+def search_cache_key(search):
+    body = json.dumps([search._index, search.to_dict()], sort_keys=True, separators=(',', ':'))
+    return f'ad-search:{hashlib.md5(body.encode(), usedforsecurity=False).hexdigest()}'
+
+
+def cached_list_result(key, builder):
+    return get_or_refresh(
+        key, builder,
+        timeout=getattr(settings, 'ADS_LIST_CACHE_TIMEOUT', 30),
+        stale_timeout=getattr(settings, 'ADS_LIST_CACHE_STALE_TIMEOUT', 300),
+    )
+
+
+async def acached_list_result(key, builder):
+    return await aget_or_refresh(
+        key, builder,
+        timeout=getattr(settings, 'ADS_LIST_CACHE_TIMEOUT', 30),
+        stale_timeout=getattr(settings, 'ADS_LIST_CACHE_STALE_TIMEOUT', 300),
+    )
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that takes the planner's estimate as the count above ADS_EXACT_COUNT_THRESHOLD rows
+    """
+
+    count_is_approximate = False
+
+    @cached_property
+    def count(self):
+        count, self.count_is_approximate = count_rows(
+            self.object_list, getattr(settings, 'ADS_EXACT_COUNT_THRESHOLD', 10000)
+        )
+        return count
+
+
+class KeysetPage:
+    """
+    One page of a KeysetPaginator, with opaque cursors to its neighbours instead of page numbers
+    """
+
+    def __init__(self, object_list, paginator, next_cursor='', previous_cursor=''):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return bool(self.next_cursor)
+
+    def has_previous(self):
+        return bool(self.previous_cursor)
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Newest-first pagination over (created_at, id) that seeks past the last row seen instead of counting and skipping
+    rows, so every page costs one index range scan of per_page + 1 rows however deep it is.
+
+    Page id lists are cached briefly per cursor; the first pages are shared by every visitor. Pass use_cache=False for
+    a client that has to read its own writes.
+    """
+
+    def __init__(self, queryset, per_page, cache_key, use_cache=True):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.cache_key = cache_key
+        self.use_cache = use_cache
+
+    @cached_property
+    def total(self):
+        """
+        (count, is_approximate) for the whole feed, estimated above ADS_EXACT_COUNT_THRESHOLD and refreshed every
+        ADS_FEED_COUNT_TIMEOUT seconds
+        """
+        return get_or_refresh(
+            f'{self.cache_key}:total',
+            lambda: count_rows(self.queryset, getattr(settings, 'ADS_EXACT_COUNT_THRESHOLD', 10000)),
+            timeout=getattr(settings, 'ADS_FEED_COUNT_TIMEOUT', 600),
+            stale_timeout=getattr(settings, 'ADS_FEED_COUNT_TIMEOUT', 600),
+        )
+
+    def page(self, cursor=None):
+        position = decode_cursor(cursor)
+
+        try:
+            created_at = datetime.fromisoformat(position['created_at'])
+            pk = int(position['id'])
+            backwards = position.get('direction') == 'previous'
+        except (TypeError, KeyError, ValueError):
+            # A missing or tampered cursor starts from the newest ad
+            created_at = pk = None
+            backwards = False
+
+        if self.use_cache:
+            ids, has_more = cached_list_result(
+                f'{self.cache_key}:{self.per_page}:{cursor if created_at is not None else "first"}',
+                lambda: self.fetch_ids(created_at, pk, backwards),
+            )
+        else:
+            ids, has_more = self.fetch_ids(created_at, pk, backwards)
+        rows = self.queryset.in_bulk([ad_id for ad_id, _ in ids])
+        # Ads deleted since the ids were cached are skipped rather than failing the page
+        object_list = [rows[ad_id] for ad_id, _ in ids if ad_id in rows]
+
+        if not ids:
+            return KeysetPage(object_list, self)
+
+        first, last = ids[0], ids[-1]
+        has_newer = has_more if backwards else created_at is not None
+        has_older = True if backwards else has_more
+
+        return KeysetPage(
+            object_list, self,
+            next_cursor=self.cursor_for(last, 'next') if has_older else '',
+            previous_cursor=self.cursor_for(first, 'previous') if has_newer else '',
+        )
+
+    def fetch_ids(self, created_at, pk, backwards):
+        """
+        Return ([(id, created_at isoformat), ...] newest first, whether more rows lie beyond them)
+        """
+        queryset = self.queryset
+
+        if created_at is not None and backwards:
+            # The created_at__gte bound lets Postgres range-scan the index; the OR only breaks ties
+            queryset = queryset.filter(created_at__gte=created_at).filter(
+                Q(created_at__gt=created_at) | Q(id__gt=pk)
+            ).order_by('created_at', 'id')
+        elif created_at is not None:
+            queryset = queryset.filter(created_at__lte=created_at).filter(
+                Q(created_at__lt=created_at) | Q(id__lt=pk)
+            ).order_by('-created_at', '-id')
+        else:
+            queryset = queryset.order_by('-created_at', '-id')
+
+        rows = list(queryset.values_list('id', 'created_at')[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if backwards:
+            rows.reverse()
+
+        return [(row_id, row_created_at.isoformat()) for row_id, row_created_at in rows], has_more
+
+    def cursor_for(self, row, direction):
+        row_id, created_at = row
+        return encode_cursor({'created_at': created_at, 'id': row_id, 'direction': direction})
+
+
+class SearchPage(Page):
+    @property
+    def next_cursor(self):
+        hits = self.paginator.result.hits if self.paginator.result else []
+
+        if not self.has_next() or not hits or 'sort' not in hits[-1]:
+            return ''
+
+        return encode_cursor({'page': self.number, 'after': hits[-1]['sort']})
+
+    @property
+    def previous_cursor(self):
+        hits = self.paginator.result.hits if self.paginator.result else []
+
+        if not self.has_previous() or not hits or 'sort' not in hits[0]:
+            return ''
+
+        return encode_cursor({'page': self.number, 'before': hits[0]['sort']})
+
+
+def reverse_sort(sort):
+    """
+    Flip every key of an elasticsearch_dsl sort, so search_after walks backwards from a hit
+    """
+    reversed_sort = []
+
+    for item in sort:
+        if isinstance(item, str):
+            field, options = item, {}
+        else:
+            field, options = next(iter(item.items()))
+            options = dict(options) if isinstance(options, dict) else {'order': options}
+
+        default_order = 'desc' if field == '_score' else 'asc'
+        options['order'] = 'asc' if options.get('order', default_order) == 'desc' else 'desc'
+        reversed_sort.append({field: options})
+
+    return reversed_sort
+
+
+class SearchPaginator(Paginator):
+    """
+    Paginate an Elasticsearch search by asking the cluster for the requested page only.
+
+    Pages inside the result window use from/size. Deeper pages need the cursor emitted by a neighbouring page and are
+    fetched with search_after, walking the sort backwards from the next page's first hit for Previous links, so the
+    cluster never has to collect more than one page of hits.
+    """
+
+    def __init__(self, search, per_page, hydrate=None, cursor=None, **kwargs):
+        super().__init__(search, per_page, **kwargs)
+        self.search = search
+        self.hydrate = hydrate
+        self.cursor = decode_cursor(cursor)
+        self.max_result_window = getattr(settings, 'ADS_SEARCH_MAX_RESULT_WINDOW', 10000)
+        self.result = None
+
+    async def aexecute(self, search):
+        # Identical searches share one cached result; hydrating still reads the current rows by id
+        async def run():
+            async with get_async_client() as client:
+                response = await client.search(index=search._index, body=search.to_dict())
+
+            return SearchResult.from_body(response.body)
+
+        return await acached_list_result(search_cache_key(search), run)
+
+    async def apage(self, number):
+        """
+        Fetch one page without blocking the event loop; hydrate may be a coroutine function. The count comes back
+        with the page, so there is no separate count request.
+        """
+        number = self._parse_number(number)
+        self.result = self._in_page_order(await self.aexecute(self._page_search(number)), number)
+        object_list = self.hydrate(self.result.hits) if self.hydrate else self.result.hits
+
+        if inspect.isawaitable(object_list):
+            object_list = await object_list
+
+        return self._build_page(number, object_list)
+
+    def _page_search(self, number):
+        search_after = self._search_after_for(number)
+        search_before = self._search_before_for(number)
+
+        if search_after is not None:
+            search = self.search.extra(from_=0, size=self.per_page, search_after=search_after)
+        elif search_before is not None:
+            search = self.search.sort(*reverse_sort(self.search._sort)).extra(
+                from_=0, size=self.per_page, search_after=search_before
+            )
+        elif number * self.per_page > self.max_result_window:
+            raise EmptyPage(self.error_messages['no_results'])
+        else:
+            search = self.search.extra(from_=(number - 1) * self.per_page, size=self.per_page)
+
+        return search.extra(track_total_hits=True)
+
+    def _build_page(self, number, object_list):
+        self.__dict__['count'] = self.result.total
+        return SearchPage(object_list, self.validate_number(number), self)
+
+    def _parse_number(self, number):
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(self.error_messages['invalid_page'])
+
+        if number < 1:
+            raise EmptyPage(self.error_messages['min_page'])
+        return number
+
+    def _search_after_for(self, number):
+        if not isinstance(self.cursor, dict) or self.cursor.get('page') != number - 1:
+            return None
+
+        after = self.cursor.get('after')
+        return after if isinstance(after, list) and after else None
+
+    def _search_before_for(self, number):
+        if not isinstance(self.cursor, dict) or self.cursor.get('page') != number + 1:
+            return None
+
+        before = self.cursor.get('before')
+        return before if isinstance(before, list) and before else None
+
+    def _in_page_order(self, result, number):
+        # A page fetched backwards comes back in reverse; the cached result is left as it is
+        if self._search_before_for(number) is None:
+            return result
+
+        return SearchResult(list(reversed(result.hits)), result.total, result.aggregations)
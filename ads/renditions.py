@@ -0,0 +1,89 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from ads.cache import invalidate_ad_detail
+from ads.indexing import enqueue_ads
+from ads.models import Ad, AdImage
+from core.utils import close_connections_before_fork, generate_upload_path
+
+
+FORMAT_EXTENSIONS = {'jpeg': 'jpg', 'webp': 'webp'}
+
+
+def render_image(source_path):
+    """
+    Write every configured rendition of one stored image and return {name: {format: storage path}}.
+    Runs in a worker process, so it only touches storage, never the database.
+    """
+    specs = getattr(settings, 'ADS_IMAGE_RENDITIONS', {})
+    formats = getattr(settings, 'ADS_IMAGE_RENDITION_FORMATS', ['jpeg', 'webp'])
+    quality = getattr(settings, 'ADS_IMAGE_RENDITION_QUALITY', 80)
+    renditions = {}
+
+    with default_storage.open(source_path) as source, Image.open(source) as original:
+        image = ImageOps.exif_transpose(original).convert('RGB')
+
+        for name, spec in specs.items():
+            size = tuple(spec['size'])
+
+            if spec.get('crop'):
+                resized = ImageOps.fit(image, size, Image.Resampling.LANCZOS)
+            else:
+                resized = image.copy()
+                resized.thumbnail(size, Image.Resampling.LANCZOS)
+
+            for image_format in formats:
+                buffer = BytesIO()
+                resized.save(buffer, format=image_format.upper(), quality=quality, optimize=True)
+                path = generate_upload_path('ad', f'{name}.{FORMAT_EXTENSIONS[image_format]}')
+                saved_path = default_storage.save(path, ContentFile(buffer.getvalue()))
+                renditions.setdefault(name, {})[image_format] = saved_path
+
+    return renditions
+
+
+def _render_safely(source_path):
+    try:
+        return render_image(source_path)
+    except Exception as e:
+        # Any failure, decompression bombs included, is recorded instead of retried forever, or the id-ordered batch
+        # would stall on the same image; templates keep serving the original
+        return {'error': str(e)}
+
+
+def generate_pending_renditions(batch_size=50, workers=None):
+    """
+    Render one batch of images that have no renditions yet, returning how many were handled
+    """
+    pending = list(
+        AdImage.objects.filter(renditions={}).order_by('id').values_list('id', 'ad_id', 'image')[:batch_size]
+    )
+
+    if not pending:
+        return 0
+
+    # Forked workers must not share the parent's database socket
+    close_connections_before_fork()
+
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork')) as executor:
+        results = executor.map(_render_safely, [image for _, _, image in pending])
+
+        for (image_id, _, image), renditions in zip(pending, results):
+            # Skip images whose file was replaced while they were being rendered
+            if AdImage.objects.filter(pk=image_id, image=image).update(renditions=renditions):
+                # update() skips the signals that keep the ad's cover copy in sync
+                Ad.objects.filter(cover_image=image_id).update(cover_renditions=renditions)
+
+    # The list cards show the card rendition, so the indexed thumbnail has to follow, and so does the detail gallery
+    enqueue_ads(ad_id for _, ad_id, _ in pending)
+
+    for ad_id in {ad_id for _, ad_id, _ in pending}:
+        invalidate_ad_detail(ad_id)
+
+    return len(pending)
@@ -0,0 +1,285 @@
+import re
+
+from django.conf import settings
+from elasticsearch import AsyncElasticsearch
+from elasticsearch_dsl import Q
+
+from ads.cache import get_category_tree, get_location_tree, get_properties, get_property_form_schema
+from ads.choices import DataType
+from ads.documents import AdDocument
+from ads.models import Ad
+
+
+PROPERTY_PARAM = re.compile(r'^prop_(\d+)(?:_(min|max))?$')
+TRUE_VALUES = ('true', '1', 'yes', 'on')
+FACET_SIZE = 50
+
+
+# Everything the ad_list.html card renders, so document-only pages never touch the database
+CARD_FIELDS = [
+    'id', 'title', 'description', 'price', 'created_at', 'thumbnail_url', 'thumbnail_srcset', 'thumbnail_webp_srcset',
+    'category', 'neighbourhood',
+]
+
+
+class SearchResult:
+    """
+    Plain snapshot of one page of search hits, detached from the Elasticsearch response objects
+    """
+
+    def __init__(self, hits, total, aggregations=None):
+        self.hits = hits
+        self.total = total
+        self.aggregations = aggregations or {}
+
+    @classmethod
+    def from_body(cls, body):
+        total = body['hits']['total']
+
+        if isinstance(total, dict):
+            total = total['value']
+
+        return cls(body['hits']['hits'], total, body.get('aggregations'))
+
+
+def parse_city_id(value):
+    if not value or not value.startswith('CITY_'):
+        return None
+
+    try:
+        return int(value.replace('CITY_', ''))
+    except ValueError:
+        return None
+
+
+def parse_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_property_filters(params):
+    """
+    Collect prop_<id>, prop_<id>_min and prop_<id>_max parameters as {prop_id: {'value'|'min'|'max': raw}}
+    """
+    filters = {}
+
+    for key, value in params.items():
+        match = PROPERTY_PARAM.match(key)
+        value = value.strip() if isinstance(value, str) else ''
+
+        if not match or not value:
+            continue
+
+        prop_id, bound = int(match.group(1)), match.group(2) or 'value'
+        filters.setdefault(prop_id, {})[bound] = value
+
+    return filters
+
+
+def _to_number(value):
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def typed_property_filters(filters):
+    """
+    Resolve parse_property_filters() output against the property data types into
+    [(prop_id, data_type, {'value'|'min_value'|'max_value': typed value})], dropping conditions that cannot apply
+    """
+    properties = get_properties() if filters else {}
+    typed = []
+
+    # Sorted so the same filters always build the same query, and therefore the same result cache key
+    for prop_id, bounds in sorted(filters.items()):
+        data_type = properties[prop_id][1] if prop_id in properties else None
+        conditions = {}
+
+        if data_type == DataType.NUMBER:
+            conditions = {
+                'value': _to_number(bounds.get('value', '')),
+                'min_value': _to_number(bounds.get('min', '')),
+                'max_value': _to_number(bounds.get('max', '')),
+            }
+        elif data_type == DataType.BOOLEAN and 'value' in bounds:
+            conditions = {'value': bounds['value'].lower() in TRUE_VALUES}
+        elif data_type in (DataType.TEXT, DataType.CHOICE) and 'value' in bounds:
+            conditions = {'value': bounds['value']}
+
+        conditions = {name: limit for name, limit in conditions.items() if limit is not None}
+
+        if conditions:
+            typed.append((prop_id, data_type, conditions))
+
+    return typed
+
+
+def property_filter_queries(filters):
+    fields = {DataType.NUMBER: 'properties.number', DataType.BOOLEAN: 'properties.boolean'}
+    queries = []
+
+    for prop_id, data_type, conditions in typed_property_filters(filters):
+        field = fields.get(data_type, 'properties.keyword')
+        limits = {'gte': conditions.get('min_value'), 'lte': conditions.get('max_value')}
+        limits = {op: limit for op, limit in limits.items() if limit is not None}
+        value_queries = []
+
+        if 'value' in conditions:
+            value_queries.append(Q('term', **{field: conditions['value']}))
+        if limits:
+            value_queries.append(Q('range', **{field: limits}))
+
+        # prop_id and its value conditions have to match inside the same nested object
+        queries.append(Q('nested', path='properties', query=Q(
+            'bool', filter=[Q('term', properties__prop_id=prop_id), *value_queries]
+        )))
+
+    return queries
+
+
+def has_search_filters(params):
+    return bool(
+        params.get('q', '').strip() or params.get('city', '') or params.get('neighbourhood', '')
+        or params.get('category', '')
+        or params.get('price_min', '') or params.get('price_max', '') or parse_property_filters(params)
+    )
+
+
+def choice_property_ids(category_id):
+    if category_id is None:
+        return []
+
+    return get_property_form_schema(category_id).choice_property_ids
+
+
+def add_facet_aggregations(search, city_id=None, category_id=None):
+    """
+    Attach the facet aggregations, so the counts come back in the same request as the page they describe
+    """
+    search.aggs.bucket('categories', 'terms', field='category.id', size=FACET_SIZE)
+    search.aggs.bucket('cities', 'terms', field='neighbourhood.city.id', size=FACET_SIZE)
+    search.aggs.bucket('price', 'histogram', field='price', min_doc_count=1,
+                       interval=getattr(settings, 'ADS_PRICE_FACET_INTERVAL', 100000))
+
+    if city_id is not None:
+        search.aggs.bucket('neighbourhoods', 'terms', field='neighbourhood.id', size=FACET_SIZE)
+
+    prop_ids = choice_property_ids(category_id)
+
+    if prop_ids:
+        (search.aggs.bucket('properties', 'nested', path='properties')
+         .bucket('choices', 'filter', filter=Q('terms', properties__prop_id=prop_ids))
+         .bucket('props', 'terms', field='properties.prop_id', size=len(prop_ids))
+         .bucket('values', 'terms', field='properties.keyword', size=FACET_SIZE))
+
+    return search
+
+
+def build_ad_search(params, with_source=False, with_facets=False):
+    keyword = ' '.join(params.get('q', '').split()).lower()
+    city_id = parse_city_id(params.get('city', ''))
+    neighbourhood_id = parse_int(params.get('neighbourhood'))
+    category_id = parse_int(params.get('category'))
+    price_range = {'gte': parse_int(params.get('price_min')), 'lte': parse_int(params.get('price_max'))}
+    price_range = {op: limit for op, limit in price_range.items() if limit is not None}
+
+    search = AdDocument.search()
+
+    if keyword:
+        search = search.query(Q('multi_match', query=keyword, fields=['title^3', 'description', 'category.name'],
+                                fuzziness='auto'))
+
+    if city_id is not None:
+        search = search.filter('term', neighbourhood__city_id=city_id)
+
+    if neighbourhood_id is not None:
+        search = search.filter('term', neighbourhood__id=neighbourhood_id)
+
+    if category_id is not None:
+        search = search.filter('term', category__path=category_id)
+
+    if price_range:
+        search = search.filter('range', price=price_range)
+
+    for query in property_filter_queries(parse_property_filters(params)):
+        search = search.filter(query)
+
+    if with_facets:
+        search = add_facet_aggregations(search, city_id=city_id, category_id=category_id)
+
+    # id is the tie-breaker that keeps pages stable and makes search_after cursors unambiguous
+    return search.sort('_score', '-created_at', '-id').source(CARD_FIELDS if with_source else False)
+
+
+async def ahydrate_ads(hits):
+    ad_ids = [int(hit['_id']) for hit in hits]
+    ads = await Ad.objects.select_related('user', 'category', 'neighbourhood__city').ain_bulk(ad_ids)
+
+    return [ads[ad_id] for ad_id in ad_ids if ad_id in ads]
+
+
+def get_async_client():
+    """
+    A new AsyncElasticsearch client, to be closed by the caller. Its connections belong to the running event loop,
+    and under WSGI every async view runs in a loop of its own that is closed after the request.
+    """
+    return AsyncElasticsearch(**settings.ELASTICSEARCH_DSL['default'])
+
+
+def documents_from_hits(hits):
+    return [AdDocument.from_es(hit) for hit in hits]
+
+
+def _buckets(aggregation):
+    return [(bucket['key'], bucket['doc_count']) for bucket in (aggregation or {}).get('buckets', [])]
+
+
+def build_facets(aggregations):
+    """
+    Turn the raw facet aggregations into labelled counts, looking up names only for the ids that came back
+    """
+    categories = _buckets(aggregations.get('categories'))
+    cities = _buckets(aggregations.get('cities'))
+    neighbourhoods = _buckets(aggregations.get('neighbourhoods'))
+    prop_buckets = aggregations.get('properties', {}).get('choices', {}).get('props', {}).get('buckets', [])
+
+    category_tree = get_category_tree()
+    category_names = {key: category_tree.get(key)['name'] for key, _ in categories if category_tree.get(key)}
+    location_tree = get_location_tree()
+    city_names = {key: location_tree.cities[key][1] for key, _ in cities if key in location_tree.cities}
+    neighbourhood_names = {
+        key: location_tree.neighbourhoods[key][1] for key, _ in neighbourhoods if key in location_tree.neighbourhoods
+    }
+    properties = get_properties()
+    property_names = {
+        bucket['key']: properties[bucket['key']][0] for bucket in prop_buckets if bucket['key'] in properties
+    }
+    interval = getattr(settings, 'ADS_PRICE_FACET_INTERVAL', 100000)
+
+    return {
+        'categories': [
+            {'id': key, 'name': category_names.get(key, key), 'count': count} for key, count in categories
+        ],
+        'cities': [
+            {'id': key, 'value': f'CITY_{key}', 'name': city_names.get(key, key), 'count': count}
+            for key, count in cities
+        ],
+        'neighbourhoods': [
+            {'id': key, 'name': neighbourhood_names.get(key, key), 'count': count} for key, count in neighbourhoods
+        ],
+        'price': [
+            {'min': int(key), 'max': int(key) + interval - 1, 'count': count}
+            for key, count in _buckets(aggregations.get('price'))
+        ],
+        'properties': [
+            {
+                'id': bucket['key'],
+                'name': property_names.get(bucket['key'], bucket['key']),
+                'values': [{'value': key, 'count': count} for key, count in _buckets(bucket.get('values'))],
+            }
+            for bucket in prop_buckets
+        ],
+    }
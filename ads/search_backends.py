@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.core.cache import cache
+from django.db.models import F, Q
+from django.utils.module_loading import import_string
+from elasticsearch import ApiError, TransportError
+
+from ads.models import Ad
+from ads.paginators import EstimatedCountPaginator, SearchPaginator
+from ads.search import (
+    ahydrate_ads, build_ad_search, documents_from_hits, parse_city_id, parse_int, parse_property_filters,
+    typed_property_filters,
+)
+from core.circuit_breaker import CircuitBreaker
+
+
+logger = logging.getLogger(__name__)
+
+
+class SearchUnavailable(Exception):
+    pass
+
+
+class SearchBackend(ABC):
+    """
+    One way of answering a filtered ad listing. page() returns (paginator, page, aggregations), where aggregations
+    feed the facet sidebar and may be empty; any exception in errors counts against the backend's circuit breaker.
+    """
+
+    name = None
+    errors = ()
+
+    def __init__(self):
+        self.breaker = CircuitBreaker(f'search:{self.name}')
+
+    @abstractmethod
+    async def page(self, params, per_page, page_number):
+        pass
+
+
+class ElasticsearchBackend(SearchBackend):
+    name = 'elasticsearch'
+    errors = (TimeoutError, ApiError, TransportError)
+
+    async def page(self, params, per_page, page_number):
+        render_from_documents = getattr(settings, 'ADS_LIST_RENDER_FROM_DOCUMENTS', False)
+        search = await sync_to_async(build_ad_search)(params, with_source=render_from_documents, with_facets=True)
+        paginator = SearchPaginator(
+            search, per_page, hydrate=documents_from_hits if render_from_documents else ahydrate_ads,
+            cursor=params.get('after'),
+        )
+        page = await asyncio.wait_for(paginator.apage(page_number), getattr(settings, 'ADS_SEARCH_TIMEOUT', 2))
+        return paginator, page, paginator.result.aggregations
+
+
+def search_ads_in_postgres(params):
+    """
+    The filters of build_ad_search() over the Ad table: full-text match on the search vector, or trigram similarity
+    on the title to tolerate typos
+    """
+    queryset = Ad.objects.select_related('user', 'category', 'neighbourhood__city')
+    keyword = ' '.join(params.get('q', '').split()).lower()
+    city_id = parse_city_id(params.get('city', ''))
+    neighbourhood_id = parse_int(params.get('neighbourhood'))
+    category_id = parse_int(params.get('category'))
+    price_min, price_max = parse_int(params.get('price_min')), parse_int(params.get('price_max'))
+    ordering = ['-created_at', '-id']
+
+    if keyword:
+        query = SearchQuery(keyword, search_type='websearch', config='simple')
+        queryset = queryset.filter(Q(search_vector=query) | Q(title__trigram_similar=keyword)).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        )
+        ordering.insert(0, '-rank')
+
+    if city_id is not None:
+        queryset = queryset.filter(neighbourhood__city_id=city_id)
+
+    if neighbourhood_id is not None:
+        queryset = queryset.filter(neighbourhood_id=neighbourhood_id)
+
+    if category_id is not None:
+        queryset = queryset.filter(category__path__contains=[category_id])
+
+    if price_min is not None:
+        queryset = queryset.filter(price__gte=price_min)
+
+    if price_max is not None:
+        queryset = queryset.filter(price__lte=price_max)
+
+    for prop_id, data_type, conditions in typed_property_filters(parse_property_filters(params)):
+        queryset = queryset.with_property(prop_id, data_type, **conditions)
+
+    return queryset.order_by(*ordering)
+
+
+class PostgresBackend(SearchBackend):
+    name = 'postgres'
+
+    async def page(self, params, per_page, page_number):
+        return await sync_to_async(self.sync_page)(params, per_page, page_number)
+
+    def sync_page(self, params, per_page, page_number):
+        paginator = EstimatedCountPaginator(search_ads_in_postgres(params), per_page)
+        page = paginator.page(page_number)
+        # Evaluated here, inside the thread, rather than lazily while the template renders
+        page.object_list = list(page.object_list)
+        return paginator, page, {}
+
+
+def get_search_backends():
+    return [
+        import_string(path)() for path in getattr(
+            settings, 'ADS_SEARCH_BACKENDS',
+            ['ads.search_backends.ElasticsearchBackend', 'ads.search_backends.PostgresBackend'],
+        )
+    ]
+
+
+async def search_page(params, per_page, page_number):
+    """
+    Answer from the first backend whose circuit is closed, falling through to the next on errors, and return
+    (backend name, paginator, page, aggregations).
+
+    Calls slower than ADS_SEARCH_SLOW_SECONDS count as failures too, so a struggling cluster is given a rest before it
+    times out outright. The last backend is tried even with its circuit open; SearchUnavailable means all of them
+    failed.
+    """
+    backends = get_search_backends()
+    slow_seconds = getattr(settings, 'ADS_SEARCH_SLOW_SECONDS', 1)
+
+    for position, backend in enumerate(backends):
+        if position < len(backends) - 1 and await backend.breaker.ais_open():
+            continue
+
+        started = time.monotonic()
+
+        try:
+            paginator, page, aggregations = await backend.page(params, per_page, page_number)
+        except backend.errors as e:
+            logger.warning('Search backend %s failed: %r', backend.name, e)
+            await backend.breaker.arecord_failure()
+            continue
+
+        elapsed = time.monotonic() - started
+
+        if elapsed > slow_seconds:
+            await backend.breaker.arecord_failure()
+        else:
+            await backend.breaker.arecord_success()
+
+        await record_backend_served(backend.name, elapsed)
+        return backend.name, paginator, page, aggregations
+
+    raise SearchUnavailable('No search backend could answer the request')
+
+
+async def record_backend_served(name, elapsed):
+    # Running per-backend request counts in the cache, next to a log line per request
+    await cache.aadd(f'metrics:search:{name}:served', 0, None)
+    await cache.aincr(f'metrics:search:{name}:served')
+    logger.info('Search served by %s in %.0f ms', name, elapsed * 1000)
@@ -0,0 +1,148 @@
+from django.db import transaction
+from django.db.models import F, JSONField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from accounts.models import Profile, User
+from ads.cache import (
+    category_tree_cache, invalidate_ad_detail, invalidate_owner_details, location_tree_cache, properties_cache,
+    property_form_schema_cache,
+)
+from ads.indexing import enqueue_ads_on_commit
+from ads.models import (
+    Ad, AdImage, AdPropertyValue, Category, CategoryProperty, CategoryPropertyValue, City, Location, Neighbourhood,
+    Property, ad_search_vector,
+)
+
+
+@receiver([post_save, post_delete], sender=Ad)
+def queue_ad(sender, instance, **kwargs):
+    # Read the id now: a deleted instance has its pk cleared before the commit callbacks run
+    ad_id = instance.pk
+    enqueue_ads_on_commit(lambda: [ad_id])
+
+
+@receiver([post_save, post_delete], sender=AdImage)
+@receiver([post_save, post_delete], sender=AdPropertyValue)
+def queue_parent_ad(sender, instance, **kwargs):
+    enqueue_ads_on_commit(lambda: [instance.ad_id])
+
+
+@receiver(post_save, sender=Category)
+def queue_category_ads(sender, instance, **kwargs):
+    # A moved category changes the indexed path of every ad below it
+    enqueue_ads_on_commit(
+        lambda: Ad.objects.filter(category__path__contains=[instance.pk]).values_list('id', flat=True)
+    )
+
+
+@receiver(post_save, sender=Neighbourhood)
+def queue_neighbourhood_ads(sender, instance, **kwargs):
+    enqueue_ads_on_commit(lambda: Ad.objects.filter(neighbourhood=instance.pk).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=City)
+def queue_city_ads(sender, instance, **kwargs):
+    enqueue_ads_on_commit(lambda: Ad.objects.filter(neighbourhood__city=instance.pk).values_list('id', flat=True))
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_tree(sender, instance, **kwargs):
+    # Bump after commit, or another worker could rebuild the new version from the old rows
+    transaction.on_commit(category_tree_cache.invalidate)
+
+
+@receiver([post_save, post_delete], sender=Location)
+@receiver([post_save, post_delete], sender=City)
+@receiver([post_save, post_delete], sender=Neighbourhood)
+def invalidate_location_tree(sender, instance, **kwargs):
+    transaction.on_commit(location_tree_cache.invalidate)
+
+
+@receiver([post_save, post_delete], sender=Property)
+def invalidate_properties(sender, instance, **kwargs):
+    transaction.on_commit(properties_cache.invalidate)
+    transaction.on_commit(property_form_schema_cache.invalidate)
+
+
+@receiver([post_save, post_delete], sender=CategoryProperty)
+@receiver([post_save, post_delete], sender=CategoryPropertyValue)
+def invalidate_property_form_schemas(sender, instance, **kwargs):
+    transaction.on_commit(property_form_schema_cache.invalidate)
+
+
+@receiver([post_save, post_delete], sender=Ad)
+def invalidate_ad_page(sender, instance, **kwargs):
+    ad_id = instance.pk
+    transaction.on_commit(lambda: invalidate_ad_detail(ad_id))
+
+
+@receiver([post_save, post_delete], sender=AdImage)
+@receiver([post_save, post_delete], sender=AdPropertyValue)
+def invalidate_parent_ad_page(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_ad_detail(instance.ad_id))
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_ad_pages(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_owner_details(instance.pk))
+
+
+@receiver(post_save, sender=Profile)
+def invalidate_profile_ad_pages(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_owner_details(instance.user_id))
+
+
+@receiver(post_save, sender=AdImage)
+def increment_image_count(sender, instance, created, **kwargs):
+    if created:
+        Ad.objects.filter(pk=instance.ad_id).update(image_count=F('image_count') + 1)
+
+
+@receiver(post_delete, sender=AdImage)
+def decrement_image_count(sender, instance, **kwargs):
+    Ad.objects.filter(pk=instance.ad_id, image_count__gt=0).update(image_count=F('image_count') - 1)
+
+
+def first_image_cover():
+    """
+    Update expressions that point an ad's cover fields at its oldest remaining image, or clear them
+    """
+    first_image = AdImage.objects.filter(ad=OuterRef('pk')).order_by('id')
+
+    return {
+        'cover_image': Subquery(first_image.values('id')[:1]),
+        'cover_image_path': Coalesce(Subquery(first_image.values('image')[:1]), Value('')),
+        'cover_renditions': Coalesce(
+            Subquery(first_image.values('renditions')[:1]), Value({}, output_field=JSONField())
+        ),
+    }
+
+
+@receiver(post_save, sender=AdImage)
+def update_cover_image(sender, instance, created, **kwargs):
+    cover = {'cover_image': instance, 'cover_image_path': instance.image.name, 'cover_renditions': instance.renditions}
+
+    # Images are never reordered and the oldest one is the cover, so a new image only takes over an empty slot
+    if created:
+        Ad.objects.filter(pk=instance.ad_id, cover_image__isnull=True).update(**cover)
+    else:
+        Ad.objects.filter(pk=instance.ad_id, cover_image=instance.pk).update(**cover)
+
+
+@receiver(post_delete, sender=AdImage)
+def replace_cover_image(sender, instance, **kwargs):
+    # Deleting the cover has already nulled cover_image through SET_NULL; any other deletion leaves the ad untouched
+    Ad.objects.filter(pk=instance.ad_id, cover_image__isnull=True).update(**first_image_cover())
+
+
+@receiver(post_save, sender=Ad)
+def update_search_vector(sender, instance, **kwargs):
+    Ad.objects.filter(pk=instance.pk).update(search_vector=ad_search_vector())
+
+
+@receiver(post_save, sender=Category)
+def update_category_search_vectors(sender, instance, **kwargs):
+    # Ads only hang off leaf categories, so only the saved category's own ads carry its name
+    Ad.objects.filter(category=instance.pk).update(search_vector=ad_search_vector())
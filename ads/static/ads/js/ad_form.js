@@ -42,24 +42,36 @@ function handleCategoryChange({ sectionId, categoryId = null, level }) {
     });
 }
 
+// Location -> City -> Neighbourhood tree, fetched once as [id, name, children] lists
+let locationTree = [];
+let selectedCities = [];
+
 function initLocationFlow() {
-    loadAndRenderDropdown({
-        url: '/ads/ajax/locations/',
-        sectionId: 'location_section',
-        level: 1,
-        labelText: 'Location',
-        valueKey: 'locationId',
-        onChange: handleLocationChange,
-        preselectIds: pageContext?.location_hierarchy?.location ? [pageContext.location_hierarchy.location.id] : null
+    loadChildren({
+        url: pageContext?.location_tree_url || '/ads/ajax/location-tree/',
+        callback: data => {
+            locationTree = data.locations || [];
+            renderDropdown({
+                items: toItems(locationTree),
+                sectionId: 'location_section',
+                level: 1,
+                labelText: 'Location',
+                valueKey: 'locationId',
+                onChange: handleLocationChange,
+                preselectIds: pageContext?.location_hierarchy?.location ? [pageContext.location_hierarchy.location.id] : null
+            });
+        }
     });
 }
 
 function handleLocationChange({ sectionId, locationId, level }) {
     clearNeighbourhood({ sectionId: sectionId, level: level });
-    if (!locationId) return;
+    const location = findNode(locationTree, locationId);
+    selectedCities = location ? location[2] : [];
+    if (!location) return;
 
-    loadAndRenderDropdown({
-        url: `/ads/ajax/cities/${locationId}/`,
+    renderDropdown({
+        items: toItems(selectedCities),
         sectionId,
         level: level + 1,
         labelText: 'City',
@@ -71,9 +83,11 @@ function handleLocationChange({ sectionId, locationId, level }) {
 
 function handleCityChange({ sectionId, cityId, level }) {
     clearNeighbourhood({ sectionId: sectionId, level: level });
-    if (!cityId) return;
-    loadAndRenderDropdown({
-        url: `/ads/ajax/neighbourhoods/${cityId}/`,
+    const city = findNode(selectedCities, cityId);
+    if (!city) return;
+
+    renderDropdown({
+        items: toItems(city[2]),
         sectionId,
         level: level + 1,
         labelText: 'Neighbourhood',
@@ -83,6 +97,15 @@ function handleCityChange({ sectionId, cityId, level }) {
     });
 }
 
+function findNode(nodes, id) {
+    if (!id) return null;
+    return nodes.find(([nodeId]) => nodeId === Number(id)) || null;
+}
+
+function toItems(nodes) {
+    return nodes.map(([id, name]) => ({ id, name }));
+}
+
 function handleNeighbourhoodChange({ sectionId, neighbourhoodId }) {
     document.getElementById('id_neighbourhood').value = neighbourhoodId;
 }
@@ -96,23 +119,29 @@ function loadAndRenderDropdown({ url, sectionId, level, labelText, valueKey, onC
     loadChildren({
         url,
         callback: data => {
-            if (!data.items || !data.items.length) {
-                if (typeof onEmpty === 'function') {
-                    onEmpty();
-                }
-                return;
-            }
-            let selectElement = addDropdown({
-                sectionId: sectionId, level: level, labelText: labelText,
-                options: data.items, valueKey: valueKey, onChange: onChange
+            renderDropdown({
+                items: data.items, sectionId, level, labelText, valueKey, onChange, preselectIds, onEmpty
             });
-            if (preselectIds) {
-                selectOptionFromArray({ selectElement: selectElement, targetArray: preselectIds });
-            }
         }
     });
 }
 
+function renderDropdown({ items, sectionId, level, labelText, valueKey, onChange, preselectIds = null, onEmpty = null }) {
+    if (!items || !items.length) {
+        if (typeof onEmpty === 'function') {
+            onEmpty();
+        }
+        return;
+    }
+    let selectElement = addDropdown({
+        sectionId: sectionId, level: level, labelText: labelText,
+        options: items, valueKey: valueKey, onChange: onChange
+    });
+    if (preselectIds) {
+        selectOptionFromArray({ selectElement: selectElement, targetArray: preselectIds });
+    }
+}
+
 function loadChildren({ url, callback }) {
     fetch(url).then(response => response.json()).then(callback).catch(error => {
         console.error('Failed to load data', error);
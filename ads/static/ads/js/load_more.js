@@ -0,0 +1,21 @@
+document.addEventListener('click', function (event) {
+    const button = event.target.closest('[data-load-more]');
+    if (!button) return;
+
+    button.disabled = true;
+
+    fetch(button.dataset.loadMore)
+        .then(response => response.text())
+        .then(html => {
+            // The next page is the same template; move its cards over and take its pagination
+            const nextPage = new DOMParser().parseFromString(html, 'text/html');
+            const cards = nextPage.getElementById('ad-cards');
+            const pagination = nextPage.getElementById('ad-pagination');
+
+            if (cards) document.getElementById('ad-cards').append(...cards.children);
+            document.getElementById('ad-pagination').replaceWith(pagination || document.createElement('nav'));
+        })
+        .catch(() => {
+            button.disabled = false;
+        });
+});
@@ -0,0 +1,92 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+from core.utils import get_file_extension
+
+
+def sniff_image_format(head):
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+EXTENSION_FORMATS = {'jpg': 'jpeg', 'jpeg': 'jpeg', 'png': 'png', 'webp': 'webp'}
+
+
+class RejectedUploadedFile(UploadedFile):
+    """
+    Stand-in for an upload that was refused while streaming; nothing of it was kept
+    """
+
+    def __init__(self, name, content_type, upload_error):
+        super().__init__(BytesIO(), name=name, content_type=content_type, size=0)
+        self.upload_error = upload_error
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    Stream ad images to a temporary file chunk by chunk, enforcing ADS_MAX_IMAGE_SIZE_MB and
+    ADS_ALLOWED_IMAGE_EXTENSIONS on the way in.
+
+    A file is refused as soon as its declared length, its running size or the magic bytes of its first chunk break
+    the rules; the rest of it is read off the wire and dropped. Memory per request stays at one chunk no matter how
+    many images are posted. With FILE_UPLOAD_TEMP_DIR on the media volume, saving the file is a rename into place.
+    """
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        temp_dir = getattr(settings, 'FILE_UPLOAD_TEMP_DIR', None)
+
+        if temp_dir:
+            os.makedirs(temp_dir, exist_ok=True)
+
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+
+        self.max_bytes = getattr(settings, 'ADS_MAX_IMAGE_SIZE_MB', 5) * 1024 * 1024
+        self.allowed_exts = getattr(settings, 'ADS_ALLOWED_IMAGE_EXTENSIONS', ['jpg', 'jpeg', 'png', 'webp'])
+        self.received = 0
+        self.upload_error = None
+        self.ext = get_file_extension(self.file)
+
+        # An extension without known magic bytes could not be checked against the content, so it is never allowed
+        if not self.ext or self.ext not in self.allowed_exts or self.ext not in EXTENSION_FORMATS:
+            self.reject(f'Unsupported file type. Allowed types: {", ".join(self.allowed_exts)}.')
+        elif content_length and content_length > self.max_bytes:
+            self.reject_oversized()
+
+    def reject(self, message):
+        self.upload_error = message
+        self.file.close()
+
+    def reject_oversized(self):
+        self.reject(f'Image size must be less than {getattr(settings, "ADS_MAX_IMAGE_SIZE_MB", 5)} MB.')
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.upload_error:
+            return None
+
+        if start == 0 and sniff_image_format(raw_data[:12]) != EXTENSION_FORMATS.get(self.ext):
+            self.reject('The file content does not match an allowed image type.')
+            return None
+
+        self.received += len(raw_data)
+
+        if self.received > self.max_bytes:
+            self.reject_oversized()
+            return None
+
+        self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if self.upload_error:
+            return RejectedUploadedFile(self.file_name, self.content_type, self.upload_error)
+
+        return super().file_complete(file_size)
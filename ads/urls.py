@@ -2,7 +2,7 @@ from django.urls import path
 
 from ads.views import AdCreateView, AdDeleteView, AdDetailView, AdListView, AdUpdateView
 from ads.views_ajax import (
-    CitiesView, LoadCategoryChildrenView, LoadCategoryPropertiesView, LocationView, NeighbourhoodView,
+    CitiesView, LoadCategoryChildrenView, LoadCategoryPropertiesView, LocationTreeView, LocationView, NeighbourhoodView,
 )
 
 
@@ -17,6 +17,7 @@ urlpatterns = [
 
     path('ajax/category_children/<int:parent_id>/', LoadCategoryChildrenView.as_view(), name='ajax-category-children'),
 
+    path('ajax/location-tree/', LocationTreeView.as_view(), name='ajax-location-tree'),
     path('ajax/locations/', LocationView.as_view(), name='ajax-locations'),
     path('ajax/cities/<int:location_id>/', CitiesView.as_view(), name='ajax-cities'),
     path('ajax/neighbourhoods/<int:city_id>/', NeighbourhoodView.as_view(), name='ajax-neighbourhoods'),
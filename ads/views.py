@@ -1,15 +1,34 @@
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.paginator import InvalidPage
 from django.db import IntegrityError, transaction
-from django.db.models import Case, Prefetch, When
 from django.forms import ValidationError
+from django.http import Http404, HttpResponseRedirect
 from django.shortcuts import redirect
-from django.urls import reverse_lazy
+from django.template.loader import render_to_string
+from django.urls import reverse, reverse_lazy
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from django.views.generic import CreateView, DeleteView, DetailView, ListView, UpdateView
-from elasticsearch_dsl import Q
 
-from ads.documents import AdDocument
-from ads.forms import AdForm, AdImageCreateFormSet, AdImageUpdateFormSet, DynamicPropertyForm, ProfileInlineForm
-from ads.models import Ad, AdImage, AdPropertyValue, Category, City, Property
+from ads.cache import (
+    aget_location_tree, get_ad_detail, get_category_tree, get_location_tree, get_property_form_schema, owner_namespace,
+)
+from ads.forms import AdForm, AdImageCreateFormSet, AdImageUpdateFormSet, ProfileInlineForm, build_property_form
+from ads.models import Ad, AdPropertyValue, Property
+from ads.paginators import KeysetPaginator
+from ads.search import build_facets, has_search_filters, parse_int
+from ads.search_backends import SearchUnavailable, search_page
+from ads.upload_handlers import ImageUploadHandler
+from core.cache import get_version
+from core.middleware import PIN_COOKIE
+
+
+logger = logging.getLogger(__name__)
 
 
 class AdListView(ListView):
@@ -19,44 +38,100 @@ class AdListView(ListView):
     paginate_by = 10
 
     def get_queryset(self):
-        keyword = self.request.GET.get('q', '').strip()
-        city_select = self.request.GET.get('city', '')
+        return super().get_queryset().select_related('user', 'category', 'neighbourhood__city')
+
+    def paginate_queryset(self, queryset, page_size):
+        # The unfiltered feed pages by cursor; search results keep numbered pages
+        # A client pinned to the primary just wrote something and should see it, not the shared cached page
+        paginator = KeysetPaginator(
+            queryset, page_size, cache_key='ad-feed', use_cache=PIN_COOKIE not in self.request.COOKIES
+        )
+        page = paginator.page(self.request.GET.get('cursor'))
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    async def get(self, request, *args, **kwargs):
+        if has_search_filters(request.GET):
+            try:
+                return await self.search(request)
+            except SearchUnavailable as e:
+                # No backend could answer, which costs the filters, not the page
+                logger.error('%s, serving the plain listing', e)
+
+        response = await sync_to_async(super().get)(request, *args, **kwargs)
+        response['X-Search-Backend'] = 'none'
+        return response
+
+    async def search(self, request):
+        """
+        Run the search and the cached context lookups concurrently
+        """
+        page_number = self.kwargs.get(self.page_kwarg) or request.GET.get(self.page_kwarg) or 1
 
-        if not keyword and not city_select:
-            return (super().get_queryset().select_related('user', 'category', 'neighbourhood').prefetch_related(
-                Prefetch('images', queryset=AdImage.objects.order_by('id'))))
+        try:
+            (backend, paginator, page, aggregations), location_tree = await asyncio.gather(
+                search_page(request.GET, self.get_paginate_by(None), page_number),
+                aget_location_tree(),
+            )
+        except InvalidPage as e:
+            raise Http404(str(e))
+
+        # get_template_names() inspects object_list, which only ListView.get() would have set
+        self.object_list = page.object_list
+        response = self.render_to_response({
+            'view': self,
+            'paginator': paginator,
+            'page_obj': page,
+            'is_paginated': page.has_other_pages(),
+            'object_list': page.object_list,
+            self.context_object_name: page.object_list,
+            'city_choices': location_tree.city_choices,
+            'query_string': self.get_query_string(),
+            'total_count': paginator.count,
+            'total_is_approximate': getattr(paginator, 'count_is_approximate', False),
+            'facets': await sync_to_async(self.get_facets)(aggregations) if aggregations else None,
+        })
+        response['X-Search-Backend'] = backend
+        return response
 
-        search = AdDocument.search()
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['city_choices'] = get_location_tree().city_choices
+        context['query_string'] = self.get_query_string()
+        context['cursor_pagination'] = True
+        context['total_count'], context['total_is_approximate'] = context['paginator'].total
+        context['load_more'] = getattr(settings, 'ADS_FEED_LOAD_MORE', False)
+        return context
 
-        if keyword:
-            search = search.query(Q('multi_match', query=keyword, fields=['title^3', 'description', 'category.name'],
-                                    fuzziness='auto'))
+    def get_query_string(self, **changes):
+        query_params = self.request.GET.copy()
+        query_params.pop('page', None)
+        query_params.pop('after', None)
+        query_params.pop('cursor', None)
 
-        try:
-            if city_select and city_select.startswith('CITY_'):
-                city_id = int(city_select.replace('CITY_', ''))
-                search = search.filter('term', neighbourhood__city_id=city_id)
-        except ValueError:
-            pass
+        for key, value in changes.items():
+            if value is None:
+                query_params.pop(key, None)
+            else:
+                query_params[key] = str(value)
 
-        response = search.scan()
-        ad_ids = [hit.id for hit in response]
+        return query_params.urlencode()
 
-        if not ad_ids:
-            return Ad.objects.none()
+    def get_facets(self, aggregations):
+        facets = build_facets(aggregations)
 
-        preserved = Case(*[When(id=id, then=pos)for pos, id in enumerate(ad_ids)])
-        queryset = (Ad.objects.filter(id__in=ad_ids).select_related('user', 'category', 'neighbourhood')
-                    .prefetch_related(Prefetch('images', queryset=AdImage.objects.order_by('id'))).order_by(preserved))
+        for item in facets['categories']:
+            item['query'] = self.get_query_string(category=item['id'])
+        for item in facets['cities']:
+            item['query'] = self.get_query_string(city=item['value'], neighbourhood=None)
+        for item in facets['neighbourhoods']:
+            item['query'] = self.get_query_string(neighbourhood=item['id'])
+        for item in facets['price']:
+            item['query'] = self.get_query_string(price_min=item['min'], price_max=item['max'])
+        for prop in facets['properties']:
+            for item in prop['values']:
+                item['query'] = self.get_query_string(**{f'prop_{prop["id"]}': item['value']})
 
-        return queryset
-
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        cities = City.objects.all()
-        city_choices = [(f'CITY_{city.id}', city.name)for city in cities]
-        context['city_choices'] = city_choices
-        return context
+        return facets
 
 
 class AdDetailView(DetailView):
@@ -69,6 +144,31 @@ class AdDetailView(DetailView):
             'user', 'user__profile', 'category', 'neighbourhood'
         ).prefetch_related('images')
 
+    def get(self, request, *args, **kwargs):
+        detail = get_ad_detail(self.kwargs['pk'], self.build_detail)
+        return self.render_to_response({'detail': detail, 'view': self})
+
+    def build_detail(self, ad_id):
+        """
+        Render the parts of the page that are the same for every visitor; phone and owner actions stay per request
+        """
+        ad = self.get_object()
+        profile = getattr(ad.user, 'profile', None)
+
+        return {
+            'pk': ad.pk,
+            'title': ad.title,
+            'owner_id': ad.user_id,
+            # A profile change committing between the query and this read is only picked up once the payload expires
+            'owner_version': get_version(owner_namespace(ad.user_id)),
+            'show_phone_number': ad.show_phone_number,
+            'phone_number': profile.phone_number if profile else None,
+            'gallery_html': render_to_string('ads/partials/ad_gallery.html', {'ad': ad}),
+            'details_html': render_to_string('ads/partials/ad_details.html', {'ad': ad}),
+        }
+
+
+@method_decorator(csrf_exempt, name='dispatch')
 class AdFormMixin(LoginRequiredMixin):
     model = Ad
     form_class = AdForm
@@ -76,6 +176,12 @@ class AdFormMixin(LoginRequiredMixin):
     success_url = reverse_lazy('ads:ad_list')
     image_formset_class = None
 
+    def dispatch(self, request, *args, **kwargs):
+        # Upload handlers can only be swapped before request.POST is read, which the CSRF check does, so the view is
+        # exempted above and protected here instead
+        request.upload_handlers = [ImageUploadHandler(request)]
+        return csrf_protect(super().dispatch)(request, *args, **kwargs)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         ad = self.object
@@ -91,22 +197,25 @@ class AdFormMixin(LoginRequiredMixin):
             context['image_formset'] = self.image_formset_class(instance=ad)
             context['profile_form'] = ProfileInlineForm(instance=self.request.user.profile, user=self.request.user)
 
-        category_id = None
+        category_id = ad.category_id if ad and ad.category_id else parse_int(self.request.POST.get('category'))
+        schema = get_property_form_schema(category_id) if category_id else None
+        values = None
 
-        if ad and ad.category_id:
-            category_id = ad.category_id
-        else:
-            category_id = self.request.POST.get('category')
+        if ad and not post_data:
+            values = dict(AdPropertyValue.objects.filter(ad=ad).values_list('prop_id', 'value'))
 
-        category = (Category.objects.filter(id=category_id).first() if category_id else None)
+        context['property_form'] = build_property_form(schema, post_data, values)
 
-        context['property_form'] = DynamicPropertyForm(post_data, category=category, ad=ad)
+        location_tree = get_location_tree()
+        context['page_context'] = {
+            'location_tree_url': f'{reverse("ads:ajax-location-tree")}?v={location_tree.etag}',
+        }
 
         if ad:
-            context['page_context'] = {
-                'category_hierarchy': ad.category.get_hierarchy,
-                'location_hierarchy': ad.neighbourhood.get_location_hierarchy(),
-            }
+            context['page_context'].update({
+                'category_hierarchy': get_category_tree().hierarchy(ad.category_id),
+                'location_hierarchy': location_tree.neighbourhood_hierarchy(ad.neighbourhood_id),
+            })
 
         return context
 
@@ -144,8 +253,12 @@ class AdFormMixin(LoginRequiredMixin):
                 if value not in (None, '', []) and int(field.split('_', 1)[1]) in properties
             ]
 
+            for ad_property_value in ad_property_values:
+                ad_property_value.set_typed_values()
+
             AdPropertyValue.objects.bulk_create(
-                ad_property_values, update_conflicts=True, unique_fields=['ad', 'prop'], update_fields=['value']
+                ad_property_values, update_conflicts=True, unique_fields=['ad', 'prop'],
+                update_fields=['value', 'value_num', 'value_bool', 'value_text'],
             )
 
             image_formset.instance = ad
@@ -157,6 +270,7 @@ class AdFormMixin(LoginRequiredMixin):
             form.add_error(None, str(e))
             return self.form_invalid(form)
 
+
 class AdCreateView(AdFormMixin, CreateView):
     image_formset_class = AdImageCreateFormSet
 
@@ -175,3 +289,8 @@ class AdDeleteView(LoginRequiredMixin, DeleteView):
 
     def get_queryset(self):
         return super().get_queryset().filter(user=self.request.user)
+
+    def form_valid(self, form):
+        # Only the flag flips here; signals queue the index removal and purge_deleted_ads drops the rows later
+        self.object.soft_delete()
+        return HttpResponseRedirect(self.get_success_url())
@@ -1,61 +1,95 @@
-from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import JsonResponse
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.http import HttpResponse, JsonResponse
 from django.template.loader import render_to_string
 from django.urls import reverse_lazy
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
 from django.views import View
+from django.views.decorators.http import condition
 
-from ads.forms import DynamicPropertyForm
-from ads.models import Ad, Category, City, Location, Neighbourhood
+from ads.cache import aget_category_tree, aget_property_form_schema, get_location_tree
+from ads.forms import build_property_form
+from ads.models import AdPropertyValue, City, Location, Neighbourhood
+from ads.search import parse_int
 
 
 class LoadCategoryChildrenView(View):
-    def get(self, request, parent_id):
-        children = None
-        if parent_id == 0:
-            children = Category.objects.filter(parent_id=None).values('id', 'name')
+    async def get(self, request, parent_id):
+        tree = await aget_category_tree()
+        return JsonResponse({'items': tree.children_of(None if parent_id == 0 else parent_id)})
+
+
+@method_decorator(condition(etag_func=lambda request: get_location_tree().etag), name='get')
+class LocationTreeView(View):
+    """
+    The whole Location -> City -> Neighbourhood tree in one cacheable response
+    """
+
+    def get(self, request):
+        tree = get_location_tree()
+        response = HttpResponse(tree.json, content_type='application/json')
+
+        # A URL pinned to the current ETag never changes content, so browsers and proxies may keep it indefinitely
+        if request.GET.get('v') == tree.etag:
+            patch_cache_control(response, public=True, max_age=60 * 60 * 24 * 365, immutable=True)
         else:
-            children = Category.objects.filter(parent_id=parent_id).values('id', 'name')
+            patch_cache_control(response, public=True, max_age=getattr(settings, 'ADS_LOCATION_TREE_MAX_AGE', 300))
 
-        return JsonResponse({'items': list(children)})
+        return response
 
 
 class LocationView(View):
-    def get(self, request):
-        locations = Location.objects.all().values('id', 'name')
-        return JsonResponse({'items': list(locations)})
+    async def get(self, request):
+        locations = [location async for location in Location.objects.values('id', 'name')]
+        return JsonResponse({'items': locations})
 
 
 class CitiesView(View):
-    def get(self, request, location_id):
-        cities = City.objects.filter(location_id=location_id).values('id', 'name')
-        return JsonResponse({'items': list(cities)})
+    async def get(self, request, location_id):
+        cities = [city async for city in City.objects.filter(location_id=location_id).values('id', 'name')]
+        return JsonResponse({'items': cities})
 
 
 class NeighbourhoodView(View):
-    def get(self, request, city_id):
-        neighbourhoods = Neighbourhood.objects.filter(city_id=city_id).values('id', 'name')
-        return JsonResponse({'items': list(neighbourhoods)})
+    async def get(self, request, city_id):
+        neighbourhoods = [
+            neighbourhood async for neighbourhood in Neighbourhood.objects.filter(city_id=city_id).values('id', 'name')
+        ]
+        return JsonResponse({'items': neighbourhoods})
 
 
-class LoadCategoryPropertiesView(LoginRequiredMixin, View):
+class LoadCategoryPropertiesView(View):
     login_url = reverse_lazy('accounts:login')
-    # important for AJAX otherwise Without this, Django redirects login page
-    redirect_field_name = None
 
-    def get(self, request, *args, **kwargs):
-        ad_id = request.GET.get('ad_id')
-        category_id = request.GET.get('category_id')
-        ad_object = Ad.objects.filter(id=ad_id).first() if ad_id else None
-        category = Category.objects.filter(id=category_id).first()
+    async def get(self, request, *args, **kwargs):
+        # LoginRequiredMixin only works with sync handlers, so the check is done here. No next parameter: for AJAX a
+        # redirect back to this endpoint after login would be useless
+        user = await request.auser()
 
-        if not category:
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path(), self.login_url, redirect_field_name=None)
+
+        ad_id = parse_int(request.GET.get('ad_id'))
+        category_id = parse_int(request.GET.get('category_id'))
+
+        if category_id is None or (await aget_category_tree()).get(category_id) is None:
             return JsonResponse({'html': ''})
 
-        form = DynamicPropertyForm(category=category, ad=ad_object)
+        schema = await aget_property_form_schema(category_id)
+        values = None
+
+        if ad_id:
+            rows = AdPropertyValue.objects.filter(ad_id=ad_id, ad__is_deleted=False).values_list('prop_id', 'value')
+            values = {prop_id: value async for prop_id, value in rows}
 
-        html = render_to_string(
+        html = await sync_to_async(self.render_form)(request, build_property_form(schema, values=values))
+        return JsonResponse({'html': html})
+
+    def render_form(self, request, form):
+        return render_to_string(
             'ads/partials/property_form.html',
             {'property_form': form},
             request=request
         )
-        return JsonResponse({'html': html})
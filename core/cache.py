@@ -0,0 +1,144 @@
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+from core.db_routers import use_primary
+
+
+def _version_key(namespace):
+    return f'version:{namespace}'
+
+
+def _seed_version():
+    # Seeded from the clock, so a version lost to eviction never comes back as a number that was already used
+    return time.time_ns() // 1000
+
+
+def get_version(namespace):
+    key = _version_key(namespace)
+    version = cache.get(key)
+
+    if version is None:
+        cache.add(key, _seed_version(), None)
+        version = cache.get(key)
+
+    return version
+
+
+async def aget_version(namespace):
+    key = _version_key(namespace)
+    version = await cache.aget(key)
+
+    if version is None:
+        await cache.aadd(key, _seed_version(), None)
+        version = await cache.aget(key)
+
+    return version
+
+
+def bump_version(namespace):
+    key = _version_key(namespace)
+
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, _seed_version(), None)
+        return cache.get(key)
+
+
+def get_or_refresh(key, builder, timeout, stale_timeout, lock_timeout=10):
+    """
+    Cache builder() for timeout seconds, then keep serving the old value for up to stale_timeout more seconds.
+
+    Once an entry is stale, the one caller that wins the refresh lock rebuilds it while everyone else gets the old
+    value, so a popular entry expiring sends a single request to the backend instead of all of them.
+    """
+    entry = cache.get(key)
+
+    if entry is not None:
+        value, fresh_until = entry
+
+        if fresh_until > time.time() or not cache.add(f'{key}:refresh', True, lock_timeout):
+            return value
+
+    value = builder()
+    cache.set(key, (value, time.time() + timeout), timeout + stale_timeout)
+    return value
+
+
+async def aget_or_refresh(key, builder, timeout, stale_timeout, lock_timeout=10):
+    """
+    get_or_refresh() for a coroutine function builder
+    """
+    entry = await cache.aget(key)
+
+    if entry is not None:
+        value, fresh_until = entry
+
+        if fresh_until > time.time() or not await cache.aadd(f'{key}:refresh', True, lock_timeout):
+            return value
+
+    value = await builder()
+    await cache.aset(key, (value, time.time() + timeout), timeout + stale_timeout)
+    return value
+
+
+class VersionedCache:
+    """
+    A value built from the database once per version of its namespace.
+
+    Each process keeps the value it last saw in memory and only checks the shared version on access. Workers that
+    miss locally load the value another worker already built from the shared cache, and a bump_version() makes every
+    worker drop its copy.
+    """
+
+    def __init__(self, namespace, builder, timeout=None):
+        self.namespace = namespace
+        self.builder = builder
+        self.timeout = timeout
+        self._local = {}
+
+    def get(self, key=None):
+        version = get_version(self.namespace)
+        local = self._local.get(key)
+
+        if local is not None and local[0] == version:
+            return local[1]
+
+        cache_key = f'{self.namespace}:{version}:{key}'
+        value = cache.get(cache_key)
+
+        if value is None:
+            value = self.build(key)
+            cache.set(cache_key, value, self.timeout)
+
+        self._local[key] = (version, value)
+        return value
+
+    async def aget(self, key=None):
+        version = await aget_version(self.namespace)
+        local = self._local.get(key)
+
+        if local is not None and local[0] == version:
+            return local[1]
+
+        cache_key = f'{self.namespace}:{version}:{key}'
+        value = await cache.aget(cache_key)
+
+        if value is None:
+            # Builders use the sync ORM, so a rebuild runs in a thread; hits never leave the event loop
+            value = await sync_to_async(self.build)(key)
+            await cache.aset(cache_key, value, self.timeout)
+
+        self._local[key] = (version, value)
+        return value
+
+    def build(self, key=None):
+        # A rebuild follows a version bump made on commit at the primary. A lagging replica would store the old rows
+        # under the new version, where they would stay until the next change
+        with use_primary():
+            return self.builder() if key is None else self.builder(key)
+
+    def invalidate(self):
+        bump_version(self.namespace)
@@ -0,0 +1,42 @@
+from django.core.cache import cache
+
+
+class CircuitBreaker:
+    """
+    Shared across processes through the cache: failure_threshold failures within window seconds open the circuit for
+    reset_timeout seconds, after which the next call is let through as a trial. A failed trial opens it again at once,
+    because the failures of the window are still counted.
+    """
+
+    def __init__(self, name, failure_threshold=5, window=60, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.window = window
+        self.reset_timeout = reset_timeout
+
+    @property
+    def failures_key(self):
+        return f'circuit:{self.name}:failures'
+
+    @property
+    def open_key(self):
+        return f'circuit:{self.name}:open'
+
+    async def ais_open(self):
+        return bool(await cache.aget(self.open_key))
+
+    async def arecord_failure(self):
+        await cache.aadd(self.failures_key, 0, self.window)
+
+        try:
+            failures = await cache.aincr(self.failures_key)
+        except ValueError:
+            # The window expired between the add and the increment
+            failures = 1
+            await cache.aset(self.failures_key, failures, self.window)
+
+        if failures >= self.failure_threshold:
+            await cache.aset(self.open_key, True, self.reset_timeout)
+
+    async def arecord_success(self):
+        await cache.adelete(self.failures_key)
@@ -0,0 +1,69 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+
+# Set by core.middleware.ReplicaRoutingMiddleware; anything outside a read-only request reads from the primary
+read_only = ContextVar('read_only', default=False)
+
+_unavailable_until = {}
+
+
+@contextmanager
+def use_primary():
+    """
+    Read from the primary inside a read-only request, for values that must not come from a lagging replica
+    """
+    token = read_only.set(False)
+
+    try:
+        yield
+    finally:
+        read_only.reset(token)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+
+
+def is_available(alias):
+    if _unavailable_until.get(alias, 0) > time.monotonic():
+        return False
+
+    try:
+        connections[alias].ensure_connection()
+    except OperationalError:
+        # Skip the replica for a while instead of paying a connection timeout on every query
+        _unavailable_until[alias] = time.monotonic() + getattr(settings, 'DB_REPLICA_RETRY_SECONDS', 30)
+        return False
+
+    return True
+
+
+class ReplicaRouter:
+    """
+    Send reads made while serving a read-only request to a random available replica, everything else to the primary
+    """
+
+    def db_for_read(self, model, **hints):
+        if not read_only.get():
+            return DEFAULT_DB_ALIAS
+
+        replicas = replica_aliases()
+        random.shuffle(replicas)
+
+        return next((alias for alias in replicas if is_available(alias)), DEFAULT_DB_ALIAS)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas mirror the primary, so objects from any of them may be related
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,60 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from core.db_routers import read_only
+
+
+PIN_COOKIE = 'primary_pin'
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Let safe-method requests read from the replicas, except for a short window after the client wrote something, so
+    that a user who just posted an ad sees it even while the replicas catch up.
+
+    Works both ways so async views are not pushed onto a thread just to pass through it.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        is_safe, token = self.start(request)
+
+        try:
+            response = self.get_response(request)
+        finally:
+            read_only.reset(token)
+
+        return self.finish(request, response, is_safe)
+
+    async def __acall__(self, request):
+        is_safe, token = self.start(request)
+
+        try:
+            response = await self.get_response(request)
+        finally:
+            read_only.reset(token)
+
+        return self.finish(request, response, is_safe)
+
+    def start(self, request):
+        is_safe = request.method in ('GET', 'HEAD', 'OPTIONS')
+        return is_safe, read_only.set(is_safe and PIN_COOKIE not in request.COOKIES)
+
+    def finish(self, request, response, is_safe):
+        if not is_safe:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=getattr(settings, 'DB_REPLICA_PIN_SECONDS', 10), httponly=True, samesite='Lax'
+            )
+
+        return response
@@ -1,10 +1,34 @@
 from django.db import models
 
 
+class SoftDeleteQuerySet(models.QuerySet):
+    def soft_delete(self):
+        return self.update(is_deleted=True)
+
+
+class SoftDeleteManager(models.Manager.from_queryset(SoftDeleteQuerySet)):
+    """
+    Hides soft-deleted rows. Use all_objects to reach them, e.g. to purge them.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(is_deleted=False)
+
+
 class BaseModel(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
     is_deleted = models.BooleanField(default=False)
 
+    objects = SoftDeleteManager()
+    all_objects = models.Manager.from_queryset(SoftDeleteQuerySet)()
+
     class Meta:
         abstract = True
+
+    def soft_delete(self):
+        """
+        Hide the row without touching anything that depends on it; delete() is still a real, cascading delete
+        """
+        self.is_deleted = True
+        self.save(update_fields=['is_deleted'])
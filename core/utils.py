@@ -1,8 +1,11 @@
 import datetime
+import json
 import os
 import uuid
 from typing import Optional
 
+from django.db import connections
+
 
 def get_file_extension(file_obj, lowercase=True) -> Optional[str]:
     name = getattr(file_obj, 'name', None)
@@ -36,3 +39,45 @@ def category_image_upload_to(instance, filename):
 
 def ad_image_upload_to(instance, filename):
     return generate_upload_path('ad', filename)
+
+
+def close_connections_before_fork():
+    """
+    Close the parent's database connections and connection pools, so forked workers open their own instead of sharing
+    the parent's sockets. A pool cannot survive a fork, its maintenance threads stay behind in the parent.
+    """
+    for connection in connections.all():
+        connection.close()
+
+        if connection.settings_dict.get('OPTIONS', {}).get('pool'):
+            connection.close_pool()
+
+
+def estimate_count(queryset):
+    """
+    The planner's row estimate for queryset, from EXPLAIN; for a whole table that is pg_class.reltuples
+    """
+    # Run EXPLAIN directly: QuerySet.explain() re-serializes the decoded plan and drops its outer list
+    sql, params = queryset.order_by().query.sql_with_params()
+
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count_rows(queryset, exact_threshold):
+    """
+    Return (count, is_approximate): the planner estimate when it is above exact_threshold, else an exact COUNT(*),
+    which is cheap for result sets that small
+    """
+    estimate = estimate_count(queryset)
+
+    if estimate > exact_threshold:
+        return estimate, True
+
+    return queryset.count(), False
@@ -0,0 +1,36 @@
+from django.contrib.auth.mixins import UserPassesTestMixin
+from django.db import connections
+from django.http import JsonResponse
+from django.views import View
+
+
+class DatabasePoolStatsView(UserPassesTestMixin, View):
+    """
+    Connection pool usage of the worker process that serves the request, for staff only.
+
+    saturation is the share of the pool's maximum size that is checked out; requests_waiting above zero means requests
+    are queueing for a connection and DB_POOL_MAX_SIZE is too small for the load.
+    """
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request):
+        stats = {}
+
+        for alias in connections:
+            pool = getattr(connections[alias], 'pool', None)
+
+            if pool is None:
+                stats[alias] = {'pooled': False}
+                continue
+
+            pool_stats = pool.get_stats()
+            in_use = pool_stats.get('pool_size', 0) - pool_stats.get('pool_available', 0)
+            stats[alias] = {
+                'pooled': True,
+                'saturation': round(in_use / pool.max_size, 2) if pool.max_size else 0,
+                **pool_stats,
+            }
+
+        return JsonResponse({'databases': stats})
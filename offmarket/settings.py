@@ -34,6 +34,10 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 ENV_PATH = os.path.join(BASE_DIR, '.env')
 load_dotenv(ENV_PATH)
 
+# Uploads stream to disk here, the system temp dir when unset. An existing directory on the media volume makes storing
+# an upload a rename rather than a copy
+FILE_UPLOAD_TEMP_DIR = os.getenv('FILE_UPLOAD_TEMP_DIR') or None
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/6.0/howto/deployment/checklist/
 
@@ -56,6 +60,8 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
+    "django.contrib.humanize",
 
     'django_elasticsearch_dsl',
     "core",
@@ -65,6 +71,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "core.middleware.ReplicaRoutingMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -97,6 +104,10 @@ WSGI_APPLICATION = "offmarket.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# DB_POOL=True hands connections out from a psycopg 3 pool per worker process; otherwise each thread keeps its
+# connection open for DB_CONN_MAX_AGE seconds and checks it is still alive before reusing it
+DB_POOL = os.getenv('DB_POOL') == 'True'
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -105,9 +116,46 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
         'PORT': os.getenv('DB_PORT'),
+        # Persistent connections and the pool are mutually exclusive
+        'CONN_MAX_AGE': 0 if DB_POOL else int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': not DB_POOL,
+        'OPTIONS': {
+            'pool': {
+                'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+                'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+                'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+            },
+        } if DB_POOL else {},
+    }
+}
+
+# Comma separated host[:port] list of read replicas; read-only requests are spread over them by core.db_routers
+for index, replica in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    host, _, port = replica.strip().partition(':')
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'], 'HOST': host, 'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['core.db_routers.ReplicaRouter']
+# Seconds a client reads from the primary after writing, and a failed replica is skipped for
+DB_REPLICA_PIN_SECONDS = 10
+DB_REPLICA_RETRY_SECONDS = 30
+
+# Cache
+# Shared across workers when REDIS_URL is set; the in-process fallback is only suitable for a single worker.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache' if os.getenv('REDIS_URL')
+        else 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': os.getenv('REDIS_URL', 'offmarket'),
     }
 }
 
+# Sessions are read from the cache first, so cached pages stay off the database for returning visitors
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -189,3 +237,34 @@ LOGOUT_REDIRECT_URL = 'accounts:login'
 ADS_MAX_IMAGES_PER_AD = 20
 ADS_MAX_IMAGE_SIZE_MB = 5
 ADS_ALLOWED_IMAGE_EXTENSIONS = ['jpg', 'jpeg', 'png', 'webp']
+ADS_SEARCH_MAX_RESULT_WINDOW = 10000
+# Seconds the list view waits for Elasticsearch before falling back to the next search backend
+ADS_SEARCH_TIMEOUT = 2
+# Tried in order; a backend that keeps failing or answering slower than ADS_SEARCH_SLOW_SECONDS is skipped for a while
+ADS_SEARCH_BACKENDS = ['ads.search_backends.ElasticsearchBackend', 'ads.search_backends.PostgresBackend']
+ADS_SEARCH_SLOW_SECONDS = 1
+ADS_LIST_RENDER_FROM_DOCUMENTS = os.getenv('ADS_LIST_RENDER_FROM_DOCUMENTS') == 'True'
+ADS_PRICE_FACET_INTERVAL = 100000
+# Seconds list and search results stay fresh, and how much longer a stale one is served while it is refreshed
+ADS_LIST_CACHE_TIMEOUT = 30
+ADS_LIST_CACHE_STALE_TIMEOUT = 300
+# Replace the Newer/Older links of the unfiltered feed with a button that appends the next page in place
+ADS_FEED_LOAD_MORE = os.getenv('ADS_FEED_LOAD_MORE') == 'True'
+# Result sets the planner estimates above this many rows show an approximate total instead of running COUNT(*)
+ADS_EXACT_COUNT_THRESHOLD = 10000
+ADS_FEED_COUNT_TIMEOUT = 600
+
+# Ads are indexed by the process_index_queue worker after their transaction commits, not inline in the request
+ELASTICSEARCH_DSL_AUTOSYNC = False
+ADS_INDEX_BATCH_SIZE = 500
+ADS_LOCATION_TREE_MAX_AGE = 300
+ADS_AD_DETAIL_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Sizes generated off-request by the generate_image_renditions worker; crop fills the box, otherwise fit inside it
+ADS_IMAGE_RENDITIONS = {
+    'card': {'size': (400, 220), 'crop': True},
+    'card_2x': {'size': (800, 440), 'crop': True},
+    'detail': {'size': (1200, 800), 'crop': False},
+}
+ADS_IMAGE_RENDITION_FORMATS = ['jpeg', 'webp']
+ADS_IMAGE_RENDITION_QUALITY = 80
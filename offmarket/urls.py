@@ -22,12 +22,14 @@ from django.contrib import admin
 from django.urls import include, path
 
 from ads.views import AdListView
+from core.views import DatabasePoolStatsView
 
 
 urlpatterns = [
     path('accounts/', include('accounts.urls')),
     path('ads/', include('ads.urls')),
     path('admin/', admin.site.urls),
+    path('health/db-pool/', DatabasePoolStatsView.as_view(), name='db-pool-stats'),
     path('', AdListView.as_view(), name='home'),
 ]
 